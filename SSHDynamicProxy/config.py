@@ -8,27 +8,177 @@ Handles saving and loading of application configuration
 
 import os
 import json
+import functools
 import logging
-import subprocess
-import urllib.request
+import mmap
+import platform
+import shutil
+import types
 from pathlib import Path
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+# orjson is optional; fall back to the stdlib json module when unavailable
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger("config")
 
+# Host platform name ("Windows", "Linux", "Darwin"), resolved once at import
+_PLATFORM = platform.system()
+
+# Default application settings (read-only; copy before mutating)
+_DEFAULT_SETTINGS = types.MappingProxyType({
+    "auto_connect_last": False,
+    "minimize_to_tray": True,
+    "start_minimized": False,
+    "check_updates": True,
+    "theme": "system",
+    "log_level": "INFO"
+})
+
+# Common obfs4proxy install locations, per platform
+_OBFS4_CANDIDATES_POSIX = (
+    "/usr/bin/obfs4proxy",
+    "/usr/local/bin/obfs4proxy"
+)
+_OBFS4_CANDIDATES_WIN = (
+    "C:/Program Files/obfs4proxy/obfs4proxy.exe",
+    "C:/obfs4proxy/obfs4proxy.exe",
+    "d:/erwin/DEV/obfs4proxy/obfs4proxy.exe",
+    "d:/erwin/DEV/obfs4proxy.exe",
+    "C:/Windows/System32/obfs4proxy.exe",
+    "C:/Program Files/Tor/obfs4proxy.exe"
+)
+
+# Files at least this large are memory-mapped when parsed
+_MMAP_THRESHOLD = 1024 * 1024
+
+
+def _json_loads(data):
+    """
+    Parse JSON from bytes, using orjson when available
+    
+    Args:
+        data (bytes): Raw JSON document
+    
+    Returns:
+        object: Parsed JSON value
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _stat_key(path):
+    """
+    Get a key that changes whenever the file at path is modified
+    
+    Args:
+        path (str): File path
+    
+    Returns:
+        tuple: (modification time in ns, size in bytes)
+    """
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _read_json(path):
+    """
+    Read and parse a JSON file as raw bytes
+    
+    The file is opened unbuffered so the whole document is read in a single
+    pre-sized read with no text decoding. Files above _MMAP_THRESHOLD are
+    memory-mapped and handed to orjson directly instead.
+    
+    Args:
+        path (str): Path to the JSON file
+    
+    Returns:
+        object: Parsed JSON value
+    """
+    with open(path, "rb", buffering=0) as f:
+        if orjson is not None and os.fstat(f.fileno()).st_size >= _MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    return orjson.loads(view)
+        return _json_loads(f.readall())
+
+
+def _json_dumps(obj):
+    """
+    Serialize an object to indented JSON bytes, using orjson when available
+    
+    Args:
+        obj (object): Value to serialize
+    
+    Returns:
+        bytes: UTF-8 encoded JSON document
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode("utf-8")
+
+
+def _write_atomic(path, data):
+    """
+    Write bytes to a file atomically via a temporary file and os.replace
+    
+    A crash mid-write leaves the previous file intact instead of a torn one.
+    
+    Args:
+        path (str): Destination file path
+        data (bytes): File contents
+    """
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+@functools.lru_cache(maxsize=1)
+def default_config_dir():
+    """
+    Get the default configuration directory based on the platform (resolved once)
+    
+    Also used for files other modules generate, such as the askpass helper
+    and obfuscation proxy configs.
+    
+    Returns:
+        Path: Path to the configuration directory
+    """
+    # Use AppData on Windows, ~/.config on Linux, ~/Library on macOS
+    if os.name == "nt":  # Windows
+        base_dir = os.environ.get("APPDATA", os.path.expanduser("~"))
+        return Path(base_dir) / "SSHDynamicProxy"
+    elif os.name == "posix":  # Linux/macOS
+        if os.path.exists(os.path.expanduser("~/.config")):
+            # Linux
+            return Path(os.path.expanduser("~/.config/ssh-dynamic-proxy"))
+        else:
+            # macOS
+            return Path(os.path.expanduser("~/Library/Application Support/SSHDynamicProxy"))
+    else:
+        # Fallback to current directory
+        return Path("./config")
+
+
 class Config:
     """
     Class to handle application configuration
     """
     
+    # obfs4proxy lookup results shared across instances, keyed by (platform, config_dir)
+    _obfs4proxy_cache = {}
+    
     def __init__(self, config_dir=None):
         """
         Initialize the configuration handler
@@ -42,123 +192,105 @@ class Config:
         else:
             self.config_dir = Path(config_dir)
             
-        # Create config directory if it doesn't exist
-        self.config_dir.mkdir(parents=True, exist_ok=True)
+        # Create config directory if it doesn't exist (owner-only permissions)
+        if not os.path.isdir(self.config_dir):
+            os.makedirs(self.config_dir, mode=0o700, exist_ok=True)
         
         # Set up file paths
         self.profiles_file = self.config_dir / "profiles.json"
         self.settings_file = self.config_dir / "settings.json"
-        self.obfs4proxy_path = self._find_obfs4proxy()  # 添加流量混淆工具路径
+        self.backup_file = self.config_dir / "profiles.backup.json"
         
-        logger.info(f"Configuration directory: {self.config_dir}")
-        logger.info(f"Profiles file: {self.profiles_file}")
-        logger.info(f"Settings file: {self.settings_file}")
-        if self.obfs4proxy_path:
-            logger.info(f"obfs4proxy found at: {self.obfs4proxy_path}")
-        else:
+        # Cache string forms for the I/O paths below
+        self._profiles_path = os.fspath(self.profiles_file)
+        self._settings_path = os.fspath(self.settings_file)
+        self._backup_path = os.fspath(self.backup_file)
+        
+        # (file stat key, profiles) from the last load or save of the profiles file
+        self._profiles_memo = None
+        self.obfs4proxy_path = self._get_obfs4proxy_path()  # 添加流量混淆工具路径
+        
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "Configuration directory: %s\nProfiles file: %s\nSettings file: %s\nobfs4proxy: %s",
+                self.config_dir, self.profiles_file, self.settings_file,
+                self.obfs4proxy_path or "not found"
+            )
+        if not self.obfs4proxy_path:
             logger.warning("obfs4proxy not found, traffic obfuscation will be disabled")
-            
-        # 检查流量混淆所需参数
-        if self.obfs4proxy_path:
-            try:
-                # 检查 obfs4proxy 版本
-                result = subprocess.run(
-                    [self.obfs4proxy_path, "--version"],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                if result.returncode == 0:
-                    version = result.stdout.strip()
-                    logger.info(f"obfs4proxy version: {version}")
-                else:
-                    logger.warning(f"obfs4proxy version check failed: {result.stderr.strip()}")
-            except Exception as e:
-                logger.error(f"Error checking obfs4proxy version: {str(e)}")
     
-    def _find_obfs4proxy(self):
+    def _get_obfs4proxy_path(self):
+        """
+        获取obfs4proxy路径，同一平台和配置目录下只查找一次，
+        找到的路径会保存到settings.json供下次启动直接使用
+        
+        Returns:
+            str: obfs4proxy可执行文件路径，如果未找到则返回 None
         """
-        查找系统上的obfs4proxy可执行文件，如果找不到则尝试自动安装
+        cache_key = (_PLATFORM, str(self.config_dir))
+        if cache_key not in Config._obfs4proxy_cache:
+            # 优先使用上次保存在settings.json中的路径
+            settings = self.load_settings()
+            path = settings.get("obfs4proxy_path")
+            if not (path and os.path.exists(path)):
+                path = self._find_obfs4proxy()
+                if path:
+                    settings["obfs4proxy_path"] = path
+                    self.save_settings(settings)
+            # 未找到（None）也缓存，同一进程内不再重复查找
+            Config._obfs4proxy_cache[cache_key] = path
+        return Config._obfs4proxy_cache[cache_key]
+    
+    @functools.cached_property
+    def obfs4proxy_version(self):
         """
-        # 检查常见安装路径
-        possible_paths = [
-            "/usr/bin/obfs4proxy",
-            "/usr/local/bin/obfs4proxy",
-            "C:/Program Files/obfs4proxy/obfs4proxy.exe",
-            "C:/obfs4proxy/obfs4proxy.exe",
-            "d:/erwin/DEV/obfs4proxy/obfs4proxy.exe",
-            "d:/erwin/DEV/obfs4proxy.exe",
-            "C:/Windows/System32/obfs4proxy.exe",
-            "C:/Program Files/Tor/obfs4proxy.exe"
-        ]
+        obfs4proxy版本字符串，首次访问时才运行版本检查
         
-        for path in possible_paths:
-            if Path(path).exists():
-                logger.info(f"Found obfs4proxy at: {path}")
-                return path
+        Returns:
+            str: obfs4proxy版本，如果未找到或检查失败则返回 None
+        """
+        if not self.obfs4proxy_path:
+            return None
+            
+        import subprocess
         
-        # 尝试在PATH中查找
         try:
-            if self.platform == "Windows":
-                result = subprocess.run(
-                    ["where", "obfs4proxy"], 
-                    capture_output=True, 
-                    text=True,
-                    creationflags=subprocess.CREATE_NO_WINDOW
-                )
-            else:
-                result = subprocess.run(
-                    ["which", "obfs4proxy"], 
-                    capture_output=True, 
-                    text=True
-                )
-                
+            # 检查 obfs4proxy 版本
+            result = subprocess.run(
+                [self.obfs4proxy_path, "--version"],
+                capture_output=True,
+                text=True,
+                timeout=5
+            )
             if result.returncode == 0:
-                path = result.stdout.strip().splitlines()[0] if self.platform == "Windows" else result.stdout.strip()
-                logger.info(f"Found obfs4proxy in PATH: {path}")
-                return path
+                version = result.stdout.strip()
+                logger.info("obfs4proxy version: %s", version)
+                return version
+            logger.warning("obfs4proxy version check failed: %s", result.stderr.strip())
         except Exception as e:
-            logger.error(f"Error searching PATH for obfs4proxy: {str(e)}")
+            logger.error("Error checking obfs4proxy version: %s", e)
+        return None
+    
+    def _find_obfs4proxy(self):
+        """
+        查找系统上的obfs4proxy可执行文件（只查找，不自动安装）
         
-        # 如果找不到，尝试自动安装
-        logger.warning("obfs4proxy not found, attempting to install...")
-        try:
-            if self.platform == "Windows":
-                # Windows安装逻辑
-                install_dir = self.config_dir / "obfs4proxy"
-                install_dir.mkdir(exist_ok=True)
-                exe_path = install_dir / "obfs4proxy.exe"
-                
-                if not exe_path.exists():
-                    logger.info("Downloading obfs4proxy for Windows...")
-                    url = "https://github.com/erwin/SSHDynamicProxy/releases/download/v1.0/obfs4proxy-windows-amd64.exe"
-                    urllib.request.urlretrieve(url, exe_path)
-                    logger.info(f"Downloaded obfs4proxy to {exe_path}")
-                
-                return str(exe_path)
-            else:
-                # Linux/macOS安装逻辑
-                logger.info("Attempting to install obfs4proxy via package manager...")
-                try:
-                    if self.platform == "Linux":
-                        subprocess.run(["sudo", "apt-get", "install", "-y", "obfs4proxy"], check=True)
-                    elif self.platform == "Darwin":
-                        subprocess.run(["brew", "install", "obfs4proxy"], check=True)
-                    
-                    # 检查安装是否成功
-                    result = subprocess.run(["which", "obfs4proxy"], capture_output=True, text=True)
-                    if result.returncode == 0:
-                        path = result.stdout.strip()
-                        logger.info(f"Successfully installed obfs4proxy at {path}")
-                        return path
-                except subprocess.CalledProcessError as e:
-                    logger.error(f"Failed to install obfs4proxy: {str(e)}")
+        Returns:
+            str: obfs4proxy可执行文件路径，如果未找到则返回 None
+        """
+        # 检查常见安装路径
+        possible_paths = _OBFS4_CANDIDATES_WIN if os.name == "nt" else _OBFS4_CANDIDATES_POSIX
         
-        except Exception as e:
-            logger.error(f"Error installing obfs4proxy: {str(e)}")
+        path = next((p for p in possible_paths if os.path.exists(p)), None)
+        if path:
+            logger.info("Found obfs4proxy at: %s", path)
+            return path
         
-        logger.error("obfs4proxy installation failed, traffic obfuscation will be disabled")
-        return None
+        # 尝试在PATH中查找
+        path = shutil.which("obfs4proxy")
+        if path:
+            logger.info("Found obfs4proxy in PATH: %s", path)
+        return path
     
     def _get_default_config_dir(self):
         """
@@ -167,20 +299,7 @@ class Config:
         Returns:
             Path: Path to the configuration directory
         """
-        # Use AppData on Windows, ~/.config on Linux, ~/Library on macOS
-        if os.name == "nt":  # Windows
-            base_dir = os.environ.get("APPDATA", os.path.expanduser("~"))
-            return Path(base_dir) / "SSHDynamicProxy"
-        elif os.name == "posix":  # Linux/macOS
-            if os.path.exists(os.path.expanduser("~/.config")):
-                # Linux
-                return Path(os.path.expanduser("~/.config/ssh-dynamic-proxy"))
-            else:
-                # macOS
-                return Path(os.path.expanduser("~/Library/Application Support/SSHDynamicProxy"))
-        else:
-            # Fallback to current directory
-            return Path("./config")
+        return default_config_dir()
     
     def load_profiles(self):
         """
@@ -189,17 +308,24 @@ class Config:
         Returns:
             list: List of profile dictionaries
         """
-        if not self.profiles_file.exists():
+        try:
+            stat_key = _stat_key(self._profiles_path)
+        except OSError:
             logger.info("Profiles file does not exist, returning empty list")
             return []
             
+        # Reuse the last parsed profiles while the file is unchanged; callers get
+        # their own copy of each (flat) profile dict so editing one cannot change the memo
+        if self._profiles_memo is not None and self._profiles_memo[0] == stat_key:
+            return [dict(p) for p in self._profiles_memo[1]]
+            
         try:
-            with open(self.profiles_file, "r") as f:
-                profiles = json.load(f)
-                logger.info(f"Loaded {len(profiles)} profiles")
-                return profiles
+            profiles = _read_json(self._profiles_path)
+            self._profiles_memo = (stat_key, profiles)
+            logger.info("Loaded %s profiles", len(profiles))
+            return [dict(p) for p in profiles]
         except Exception as e:
-            logger.error(f"Error loading profiles: {str(e)}")
+            logger.error("Error loading profiles: %s", e)
             return []
     
     def save_profiles(self, profiles):
@@ -213,12 +339,13 @@ class Config:
             bool: True if successful, False otherwise
         """
         try:
-            with open(self.profiles_file, "w") as f:
-                json.dump(profiles, f, indent=2)
-                logger.info(f"Saved {len(profiles)} profiles")
-                return True
+            _write_atomic(self._profiles_path, _json_dumps(profiles))
+            # What was just written is what the next load would parse
+            self._profiles_memo = (_stat_key(self._profiles_path), [dict(p) for p in profiles])
+            logger.info("Saved %s profiles", len(profiles))
+            return True
         except Exception as e:
-            logger.error(f"Error saving profiles: {str(e)}")
+            logger.error("Error saving profiles: %s", e)
             return False
     
     def load_settings(self):
@@ -228,24 +355,18 @@ class Config:
         Returns:
             dict: Settings dictionary
         """
-        if not self.settings_file.exists():
+        if not os.path.exists(self._settings_path):
             logger.info("Settings file does not exist, returning default settings")
             return self.get_default_settings()
             
         try:
-            with open(self.settings_file, "r") as f:
-                settings = json.load(f)
-                logger.info("Settings loaded")
-                
-                # Merge with defaults to ensure all settings exist
-                default_settings = self.get_default_settings()
-                for key, value in default_settings.items():
-                    if key not in settings:
-                        settings[key] = value
-                        
-                return settings
+            settings = _read_json(self._settings_path)
+            logger.info("Settings loaded")
+            
+            # Merge with defaults to ensure all settings exist (loaded values win)
+            return {**_DEFAULT_SETTINGS, **settings}
         except Exception as e:
-            logger.error(f"Error loading settings: {str(e)}")
+            logger.error("Error loading settings: %s", e)
             return self.get_default_settings()
     
     def save_settings(self, settings):
@@ -259,12 +380,11 @@ class Config:
             bool: True if successful, False otherwise
         """
         try:
-            with open(self.settings_file, "w") as f:
-                json.dump(settings, f, indent=2)
-                logger.info("Settings saved")
-                return True
+            _write_atomic(self._settings_path, _json_dumps(settings))
+            logger.info("Settings saved")
+            return True
         except Exception as e:
-            logger.error(f"Error saving settings: {str(e)}")
+            logger.error("Error saving settings: %s", e)
             return False
     
     def get_default_settings(self):
@@ -274,14 +394,7 @@ class Config:
         Returns:
             dict: Default settings dictionary
         """
-        return {
-            "auto_connect_last": False,
-            "minimize_to_tray": True,
-            "start_minimized": False,
-            "check_updates": True,
-            "theme": "system",
-            "log_level": "INFO"
-        }
+        return dict(_DEFAULT_SETTINGS)
     
     def backup_profiles(self):
         """
@@ -290,19 +403,16 @@ class Config:
         Returns:
             bool: True if successful, False otherwise
         """
-        if not self.profiles_file.exists():
+        if not os.path.exists(self._profiles_path):
             logger.info("No profiles file to backup")
             return False
             
         try:
-            backup_file = self.config_dir / "profiles.backup.json"
-            with open(self.profiles_file, "r") as src:
-                with open(backup_file, "w") as dst:
-                    dst.write(src.read())
-            logger.info(f"Profiles backed up to {backup_file}")
+            shutil.copyfile(self._profiles_path, self._backup_path)
+            logger.info("Profiles backed up to %s", self._backup_path)
             return True
         except Exception as e:
-            logger.error(f"Error backing up profiles: {str(e)}")
+            logger.error("Error backing up profiles: %s", e)
             return False
     
     def restore_profiles_backup(self):
@@ -312,19 +422,16 @@ class Config:
         Returns:
             bool: True if successful, False otherwise
         """
-        backup_file = self.config_dir / "profiles.backup.json"
-        if not backup_file.exists():
+        if not os.path.exists(self._backup_path):
             logger.info("No backup file to restore")
             return False
             
         try:
-            with open(backup_file, "r") as src:
-                with open(self.profiles_file, "w") as dst:
-                    dst.write(src.read())
+            shutil.copyfile(self._backup_path, self._profiles_path)
             logger.info("Profiles restored from backup")
             return True
         except Exception as e:
-            logger.error(f"Error restoring profiles: {str(e)}")
+            logger.error("Error restoring profiles: %s", e)
             return False
     
     def export_profiles(self, export_path):
@@ -337,58 +444,57 @@ class Config:
         Returns:
             bool: True if successful, False otherwise
         """
-        if not self.profiles_file.exists():
+        if not os.path.exists(self._profiles_path):
             logger.info("No profiles to export")
             return False
             
         try:
-            with open(self.profiles_file, "r") as src:
-                with open(export_path, "w") as dst:
-                    dst.write(src.read())
-            logger.info(f"Profiles exported to {export_path}")
+            shutil.copyfile(self._profiles_path, export_path)
+            logger.info("Profiles exported to %s", export_path)
             return True
         except Exception as e:
-            logger.error(f"Error exporting profiles: {str(e)}")
+            logger.error("Error exporting profiles: %s", e)
             return False
     
-    def import_profiles(self, import_path, merge=True):
+    def import_profiles(self, import_path, merge=True, existing_profiles=None):
         """
         Import profiles from a file
         
         Args:
             import_path (str): Path to import the profiles from
             merge (bool): Whether to merge with existing profiles or replace them
+            existing_profiles (list, optional): Profiles already loaded by the caller,
+                used for merging instead of re-reading the profiles file
         
         Returns:
             bool: True if successful, False otherwise
         """
         try:
-            with open(import_path, "r") as f:
-                imported_profiles = json.load(f)
-                
-            if merge and self.profiles_file.exists():
+            imported_profiles = _read_json(import_path)
+            
+            if merge and (existing_profiles is not None or os.path.exists(self._profiles_path)):
                 # Merge with existing profiles
-                existing_profiles = self.load_profiles()
+                if existing_profiles is None:
+                    existing_profiles = self.load_profiles()
+                merged = {p["name"]: p for p in existing_profiles}
+            else:
+                # Replace existing profiles
+                merged = {}
                 
-                # Create a set of existing profile names for quick lookup
-                existing_names = {p["name"] for p in existing_profiles}
+            # Add profiles that don't already exist; duplicate names in the
+            # imported file keep their first occurrence
+            for profile in imported_profiles:
+                merged.setdefault(profile["name"], profile)
                 
-                # Add profiles that don't already exist
-                for profile in imported_profiles:
-                    if profile["name"] not in existing_names:
-                        existing_profiles.append(profile)
-                        
-                # Save merged profiles
-                self.save_profiles(existing_profiles)
-                logger.info(f"Merged {len(imported_profiles)} imported profiles with existing profiles")
+            self.save_profiles(list(merged.values()))
+            if merge:
+                logger.info("Merged %s imported profiles with existing profiles", len(imported_profiles))
             else:
-                # Replace existing profiles
-                self.save_profiles(imported_profiles)
-                logger.info(f"Imported {len(imported_profiles)} profiles")
+                logger.info("Imported %s profiles", len(imported_profiles))
                 
             return True
         except Exception as e:
-            logger.error(f"Error importing profiles: {str(e)}")
+            logger.error("Error importing profiles: %s", e)
             return False
 
 
@@ -417,4 +523,8 @@ def test_config():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
     test_config()
@@ -8,17 +8,93 @@ A GUI application to easily set up SSH dynamic proxies (SOCKS)
 
 import os
 import sys
-import json
+import atexit
+import signal
+import logging
+import collections
+import queue
+import concurrent.futures
 import threading
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
 import subprocess
 from datetime import datetime
-import ttkthemes  # 添加主题支持
+from time import strftime, localtime
 
 from ssh_proxy import SSHProxy
 from config import Config
 
+logger = logging.getLogger("main")
+
+# Maximum number of lines kept in the status text area
+MAX_STATUS_LINES = 500
+
+# Delay (ms) before pending profile changes are written to disk
+PROFILES_FLUSH_DELAY_MS = 500
+
+# 常用字体，避免在每个控件处重复构造
+FONT_UI_8 = ('Segoe UI', 8)
+FONT_UI_9 = ('Segoe UI', 9)
+FONT_UI_10 = ('Segoe UI', 10)
+
+# 常用的 grid sticky 组合
+STICKY_WE = tk.W + tk.E
+STICKY_WN = tk.W + tk.N
+
+# 混淆协议配置字段映射: 协议 -> ((配置键, 配置文件字段, 默认值), ...)
+OBFS_FIELD_MAP = {
+    'obfs4': (
+        ('bridge', 'obfs_bridge', ''),
+        ('cert', 'obfs_cert', ''),
+    ),
+    'stunnel': (
+        ('local_port', 'stunnel_local_port', '1081'),
+        ('remote', 'stunnel_remote', ''),
+        ('verify', 'stunnel_verify', False),
+        ('options', 'stunnel_options', ''),
+    ),
+    'shadowsocks': (
+        ('server', 'ss_server', ''),
+        ('port', 'ss_port', '8388'),
+        ('password', 'ss_password', ''),
+        ('method', 'ss_method', 'aes-256-gcm'),
+    ),
+    'v2ray': (
+        ('server', 'v2ray_server', ''),
+        ('port', 'v2ray_port', '1080'),
+        ('uuid', 'v2ray_uuid', ''),
+        ('alter_id', 'v2ray_alter_id', '0'),
+        ('security', 'v2ray_security', 'auto'),
+    ),
+}
+
+# 固定的加密方式选项
+SS_METHODS = ('aes-256-gcm', 'aes-128-gcm', 'chacha20-ietf-poly1305', 'aes-256-cfb', 'aes-128-cfb')
+V2RAY_SECURITY_OPTIONS = ('auto', 'aes-128-gcm', 'chacha20-poly1305', 'none')
+
+# 配置对话框中混淆协议区域的说明文字
+OBFS_HELP_TEXT = (
+    "Note: Select an obfuscation protocol to bypass network restrictions.\n"
+    "- Obfs4: Get bridge info from Tor Project\n"
+    "- Stunnel: Configure SSL/TLS encryption\n"
+    "- Shadowsocks: Configure server and encryption method\n"
+    "- V2Ray: Configure server and protocol settings"
+)
+
+def build_obfs_config(profile, obfs_protocol):
+    """
+    Build the obfuscation config dict for a profile
+    
+    Args:
+        profile: Profile dict
+        obfs_protocol: Obfuscation protocol name
+        
+    Returns:
+        dict: Config for the protocol, empty for unknown protocols
+    """
+    return {key: profile.get(field, default)
+            for key, field, default in OBFS_FIELD_MAP.get(obfs_protocol, ())}
+
 class SSHDynamicProxyApp:
     def __init__(self, root):
         self.root = root
@@ -27,26 +103,50 @@ class SSHDynamicProxyApp:
         self.root.resizable(True, True)
         
         # 应用现代化主题
+        import ttkthemes  # 添加主题支持，延迟导入以加快启动
         self.style = ttkthemes.ThemedStyle(self.root)
         self.style.set_theme("arc")  # 使用现代化主题
-        self.style.configure('TButton', padding=6, font=('Segoe UI', 10))
-        self.style.configure('TLabel', font=('Segoe UI', 10))
-        self.style.configure('TFrame', background=self.style.lookup('TFrame', 'background'))
+        self.style.configure('TButton', padding=6, font=FONT_UI_10)
+        self.style.configure('TLabel', font=FONT_UI_10)
+        bg = self.style.lookup('TFrame', 'background')
+        self.style.configure('TFrame', background=bg)
         
         # 设置主窗口背景色
-        self.root.configure(bg=self.style.lookup('TFrame', 'background'))
+        self.root.configure(bg=bg)
         
         # 设置图标
-        try:
-            self.root.iconbitmap("icon.ico")
-        except:
-            pass
+        icon = os.path.join(os.path.dirname(os.path.abspath(__file__)), "icon.ico")
+        if os.path.exists(icon):
+            try:
+                self.root.iconbitmap(icon)
+            except tk.TclError:
+                pass
             
         # Initialize variables
         self.config = Config()
         self.profiles = self.config.load_profiles()
         self.active_connections = {}
+        # Names of profiles whose connect is still running on the worker pool
+        self._pending_connects = set()
         self.ssh_proxy = SSHProxy()
+        # Pending profile writes, flushed after PROFILES_FLUSH_DELAY_MS
+        self._profiles_dirty = False
+        self._profiles_flush_id = None
+        # Documentation window, created on first use
+        self._doc_window = None
+        # Worker pool for connection setup, kept warm across connects
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix='sshdp'
+        )
+        # Finished connects handed from worker threads to the Tk main loop
+        self._ui_queue = queue.Queue()
+        self.root.bind('<<ConnectDone>>', self._on_connect_done_event)
+        # SSH stderr lines handed from reader threads to the status area
+        self._output_queue = queue.Queue()
+        self.root.bind('<<SSHOutput>>', self._on_ssh_output_event)
+        # Health check results handed from health check threads to the Tk main loop
+        self._health_queue = queue.Queue()
+        self.root.bind('<<HealthCheck>>', self._on_health_check_event)
         
         # Create GUI elements
         self.create_menu()
@@ -61,6 +161,12 @@ class SSHDynamicProxyApp:
         # Bind window close event
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
+        # 确保进程被杀死或异常退出时也能清理SSH/混淆子进程
+        atexit.register(self._reap_all)
+        for signame in ('SIGTERM', 'SIGBREAK'):
+            if hasattr(signal, signame):
+                signal.signal(getattr(signal, signame), self._on_terminate_signal)
+        
     def create_menu(self):
         """Create the application menu"""
         menubar = tk.Menu(self.root)
@@ -71,7 +177,7 @@ class SSHDynamicProxyApp:
         file_menu.add_command(label="Import Profiles", command=self.import_profiles)
         file_menu.add_command(label="Export Profiles", command=self.export_profiles)
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.root.quit)
+        file_menu.add_command(label="Exit", command=self.quit_app)
         menubar.add_cascade(label="File", menu=file_menu)
         
         # Help menu
@@ -96,6 +202,10 @@ class SSHDynamicProxyApp:
         self.profile_listbox = tk.Listbox(profile_frame, selectmode=tk.SINGLE, activestyle='dotbox')
         self.profile_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.profile_listbox.bind('<<ListboxSelect>>', self.on_profile_select)
+        # 当前选中项索引，仅在 <<ListboxSelect>> 中更新
+        self._selected_index = None
+        # Names currently shown in the listbox, used to patch only changed rows
+        self._prev_listbox_items = []
         
         scrollbar = ttk.Scrollbar(profile_frame, orient=tk.VERTICAL, command=self.profile_listbox.yview)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -133,7 +243,7 @@ class SSHDynamicProxyApp:
         
         # 状态栏样式
         self.status_text = tk.Text(status_frame, height=6, 
-                                 font=('Segoe UI', 9), 
+                                 font=FONT_UI_9, 
                                  bg="#f0f0f0", fg="#333")
         self.status_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         self.status_text.config(state=tk.DISABLED)
@@ -151,6 +261,11 @@ class SSHDynamicProxyApp:
                                      font=('Segoe UI', 9, 'bold'))
         self.socks5_label.pack(side=tk.LEFT, padx=5)
         
+        # 状态消息缓冲，空闲时批量写入
+        # 超出上限的旧消息无论如何都会被裁掉，缓冲区也按同样上限截断
+        self._status_buf = collections.deque(maxlen=MAX_STATUS_LINES)
+        self._status_pending = False
+        
         # 添加初始状态消息
         self.update_status("应用已启动。准备连接...")
         
@@ -158,38 +273,76 @@ class SSHDynamicProxyApp:
         copyright_frame = ttk.Frame(self.root)
         copyright_frame.pack(fill=tk.X, padx=10, pady=(0, 5))
         ttk.Label(copyright_frame, text="© 2025 SSH动态代理工具 v1.1.0", 
-                 font=('Segoe UI', 8), foreground="#777").pack(side=tk.RIGHT)
+                 font=FONT_UI_8, foreground="#777").pack(side=tk.RIGHT)
     
     def load_profiles_to_listbox(self):
         """Load saved profiles into the listbox"""
-        self.profile_listbox.delete(0, tk.END)
-        for profile in self.profiles:
-            self.profile_listbox.insert(tk.END, profile['name'])
+        names = [profile['name'] for profile in self.profiles]
+        prev = self._prev_listbox_items
+        
+        # 记住当前选中的配置名，重建后按名称恢复选中
+        selected = self._selected_index
+        selected_name = prev[selected] if selected is not None and selected < len(prev) else None
+        
+        # 只修改变化的行，避免每次都整体重建
+        changed = [i for i, (old, new) in enumerate(zip(prev, names)) if old != new]
+        if len(names) == len(prev) and len(changed) <= 1:
+            for i in changed:
+                self.profile_listbox.delete(i)
+                self.profile_listbox.insert(i, names[i])
+            self.profile_listbox.selection_clear(0, tk.END)
+        elif len(names) == len(prev) + 1 and not changed:
+            self.profile_listbox.insert(tk.END, names[-1])
+            self.profile_listbox.selection_clear(0, tk.END)
+        else:
+            self.profile_listbox.delete(0, tk.END)
+            if names:
+                self.profile_listbox.insert(tk.END, *names)
+        
+        self._prev_listbox_items = names
+        self._selected_index = None
+        self._profiles_by_name = {p['name']: p for p in self.profiles}
+        
+        if selected_name in self._profiles_by_name:
+            restore = names.index(selected_name)
+        elif selected is not None and len(names) == len(prev):
+            # 同一行被重命名（编辑）
+            restore = selected
+        else:
+            restore = None
+        if restore is not None:
+            self.profile_listbox.selection_set(restore)
+            self.profile_listbox.see(restore)
+            self.on_profile_select(None)
     
     def on_profile_select(self, event):
         """Handle profile selection from listbox"""
-        if not self.profile_listbox.curselection():
+        selection = self.profile_listbox.curselection()
+        self._selected_index = selection[0] if selection else None
+        if self._selected_index is None:
             return
             
-        index = self.profile_listbox.curselection()[0]
-        profile = self.profiles[index]
+        profile = self.profiles[self._selected_index]
         
         # Update details text
         self.details_text.config(state=tk.NORMAL)
         self.details_text.delete(1.0, tk.END)
         
-        details = f"Name: {profile['name']}\n"
-        details += f"Host: {profile['host']}\n"
-        details += f"Port: {profile['port']}\n"
-        details += f"Username: {profile['username']}\n"
-        details += f"Authentication: {'Key' if profile.get('key_path') else 'Password'}\n"
+        lines = [
+            f"Name: {profile['name']}",
+            f"Host: {profile['host']}",
+            f"Port: {profile['port']}",
+            f"Username: {profile['username']}",
+            f"Authentication: {'Key' if profile.get('key_path') else 'Password'}",
+        ]
         if profile.get('key_path'):
-            details += f"Key Path: {profile['key_path']}\n"
-        details += f"Local Port: {profile['local_port']}\n"
+            lines.append(f"Key Path: {profile['key_path']}")
+        lines.append(f"Local Port: {profile['local_port']}")
         if profile.get('description'):
-            details += f"\nDescription: {profile['description']}\n"
+            lines.append(f"\nDescription: {profile['description']}")
+        lines.append("")
             
-        self.details_text.insert(tk.END, details)
+        self.details_text.insert(tk.END, "\n".join(lines))
         self.details_text.config(state=tk.DISABLED)
         
         # Update button states
@@ -206,65 +359,87 @@ class SSHDynamicProxyApp:
         dialog = ProfileDialog(self.root, "New SSH Profile")
         if dialog.result:
             self.profiles.append(dialog.result)
-            self.config.save_profiles(self.profiles)
+            self._mark_profiles_dirty()
             self.load_profiles_to_listbox()
             self.update_status(f"Profile '{dialog.result['name']}' created.")
     
+    def _mark_profiles_dirty(self):
+        """Schedule a debounced save of self.profiles"""
+        self._profiles_dirty = True
+        if self._profiles_flush_id is None:
+            self._profiles_flush_id = self.root.after(PROFILES_FLUSH_DELAY_MS, self._flush_profiles)
+    
+    def _flush_profiles(self):
+        """Write pending profile changes to disk immediately"""
+        if self._profiles_flush_id is not None:
+            try:
+                self.root.after_cancel(self._profiles_flush_id)
+            except tk.TclError:
+                # Called from atexit after the window has been destroyed
+                pass
+            self._profiles_flush_id = None
+        if self._profiles_dirty:
+            self._profiles_dirty = False
+            self.config.save_profiles(self.profiles)
+    
     def edit_profile(self):
         """Edit the selected profile"""
-        if not self.profile_listbox.curselection():
+        index = self._selected_index
+        if index is None:
             messagebox.showinfo("Info", "Please select a profile to edit.")
             return
             
-        index = self.profile_listbox.curselection()[0]
         profile = self.profiles[index]
         
         # Check if profile is connected
-        if profile['name'] in self.active_connections:
+        if profile['name'] in self.active_connections or profile['name'] in self._pending_connects:
             messagebox.showwarning("Warning", "Please disconnect the profile before editing.")
             return
             
         dialog = ProfileDialog(self.root, "Edit SSH Profile", profile)
         if dialog.result:
             self.profiles[index] = dialog.result
-            self.config.save_profiles(self.profiles)
+            self._mark_profiles_dirty()
             self.load_profiles_to_listbox()
             self.update_status(f"Profile '{dialog.result['name']}' updated.")
     
     def delete_profile(self):
         """Delete the selected profile"""
-        if not self.profile_listbox.curselection():
+        index = self._selected_index
+        if index is None:
             messagebox.showinfo("Info", "Please select a profile to delete.")
             return
             
-        index = self.profile_listbox.curselection()[0]
         profile = self.profiles[index]
         
         # Check if profile is connected
-        if profile['name'] in self.active_connections:
+        if profile['name'] in self.active_connections or profile['name'] in self._pending_connects:
             messagebox.showwarning("Warning", "Please disconnect the profile before deleting.")
             return
             
         confirm = messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete the profile '{profile['name']}'?")
         if confirm:
             del self.profiles[index]
-            self.config.save_profiles(self.profiles)
+            self._mark_profiles_dirty()
             self.load_profiles_to_listbox()
             self.update_status(f"Profile '{profile['name']}' deleted.")
     
     def connect_profile(self):
         """Connect to the selected SSH profile"""
-        if not self.profile_listbox.curselection():
+        index = self._selected_index
+        if index is None:
             messagebox.showinfo("Info", "Please select a profile to connect.")
             return
             
-        index = self.profile_listbox.curselection()[0]
         profile = self.profiles[index]
         
         # Check if already connected
         if profile['name'] in self.active_connections:
             messagebox.showinfo("Info", f"Profile '{profile['name']}' is already connected.")
             return
+        if profile['name'] in self._pending_connects:
+            messagebox.showinfo("Info", f"Profile '{profile['name']}' is already connecting.")
+            return
             
         # Get password if needed
         password = None
@@ -275,89 +450,153 @@ class SSHDynamicProxyApp:
             if password is None:  # User cancelled
                 return
         
-        # Start connection in a separate thread
+        # Start connection on the worker pool
         self.update_status(f"Connecting to {profile['host']}...")
         
-        def connect_thread():
+        connect_args = self._connect_args(profile, password)
+        self._pending_connects.add(profile['name'])
+        future = self._executor.submit(
+            self.ssh_proxy.connect, local_port=profile['local_port'], **connect_args
+        )
+        future.add_done_callback(lambda f: self._post_connect_done(profile, f, connect_args))
+    
+    def _post_connect_done(self, profile, future, connect_args):
+        """Queue a finished connect and wake the Tk main loop (called from worker threads)"""
+        self._ui_queue.put((profile, future, connect_args))
+        try:
+            self.root.event_generate('<<ConnectDone>>', when='tail')
+        except (tk.TclError, RuntimeError):
+            # The window has been destroyed while the connect was running: nothing
+            # will take over the tunnel, so close it here instead of leaking it
+            if future.exception() is None:
+                self.ssh_proxy.disconnect(future.result())
+    
+    def _on_connect_done_event(self, event=None):
+        """Drain finished connects queued by worker threads"""
+        while True:
             try:
-                # 获取混淆协议配置（如果有）
-                obfs_protocol = profile.get('obfs_protocol', 'none')
-                obfs_config = {}
-                
-                # 根据不同的混淆协议设置配置
-                if obfs_protocol == 'obfs4':
-                    obfs_config = {
-                        'bridge': profile.get('obfs_bridge', ''),
-                        'cert': profile.get('obfs_cert', '')
-                    }
-                elif obfs_protocol == 'stunnel':
-                    obfs_config = {
-                        'local_port': profile.get('stunnel_local_port', '1081'),
-                        'remote': profile.get('stunnel_remote', ''),
-                        'verify': profile.get('stunnel_verify', False),
-                        'options': profile.get('stunnel_options', '')
-                    }
-                elif obfs_protocol == 'shadowsocks':
-                    obfs_config = {
-                        'server': profile.get('ss_server', ''),
-                        'port': profile.get('ss_port', '8388'),
-                        'password': profile.get('ss_password', ''),
-                        'method': profile.get('ss_method', 'aes-256-gcm')
-                    }
-                elif obfs_protocol == 'v2ray':
-                    obfs_config = {
-                        'server': profile.get('v2ray_server', ''),
-                        'port': profile.get('v2ray_port', '1080'),
-                        'uuid': profile.get('v2ray_uuid', ''),
-                        'alter_id': profile.get('v2ray_alter_id', '0'),
-                        'security': profile.get('v2ray_security', 'auto')
-                    }
+                profile, future, connect_args = self._ui_queue.get_nowait()
+            except queue.Empty:
+                return
+            self._on_connect_done(profile, future, connect_args)
+    
+    def _on_connect_done(self, profile, future, connect_args):
+        """
+        Handle a finished connect on the main thread
+        
+        Args:
+            profile: Profile dict that was connected
+            future: Future returned by submitting SSHProxy.connect
+            connect_args: Keyword arguments of that connect, reused by the
+                health check to reconnect
+        """
+        self._pending_connects.discard(profile['name'])
+        error = future.exception()
+        if error is not None:
+            self.handle_connection_error(profile['name'], str(error))
+            return
+            
+        # 处理返回结果：可能是单个进程，也可能是(ssh_process, obfs_protocol_instance)
+        result = future.result()
+        if isinstance(result, tuple):
+            ssh_process, obfs_protocol_instance = result
+        else:
+            ssh_process = result
+            obfs_protocol_instance = None
+        
+        if ssh_process:
+            profile_name = profile['name']
+            connection = {
+                'ssh_process': ssh_process,
+                'obfs_protocol_instance': obfs_protocol_instance,
+                'profile': profile,
+                'started': datetime.now()
+            }
+            # 健康检查重连后的新连接通过回调交回主线程
+            last = {'process': result}
+            
+            def on_health(healthy, process):
+                reconnected = process is not last['process']
+                last['process'] = process
+                self._post_health_check(profile_name, connection, healthy, process, reconnected)
                 
-                # 调用修改后的connect方法
-                result = self.ssh_proxy.connect(
-                    profile['host'],
-                    profile['port'],
-                    profile['username'],
-                    profile['local_port'],
-                    password=password,
-                    key_path=profile.get('key_path'),
-                    obfs_protocol=obfs_protocol if obfs_protocol != 'none' else None,
-                    obfs_config=obfs_config
-                )
+            connection['health_check'] = self.ssh_proxy.start_health_check(
+                result,
+                profile['local_port'],
+                callback=on_health,
+                connect_args=connect_args
+            )
+            self.active_connections[profile_name] = connection
+            self.update_connection_status(profile_name, True)
+    
+    def _connect_args(self, profile, password):
+        """
+        Build the SSHProxy.connect keyword arguments for a profile, other than local_port
+        
+        Args:
+            profile: Profile dict
+            password: SSH password, or None for key authentication
+            
+        Returns:
+            dict: Keyword arguments, also used by the health check to reconnect
+        """
+        # 获取混淆协议配置（如果有）
+        obfs_protocol = profile.get('obfs_protocol', 'none')
+        obfs_config = build_obfs_config(profile, obfs_protocol) if obfs_protocol != 'none' else {}
+        profile_name = profile['name']
+        
+        return {
+            'host': profile['host'],
+            'port': profile['port'],
+            'username': profile['username'],
+            'password': password,
+            'key_path': profile.get('key_path'),
+            'obfs_protocol': obfs_protocol if obfs_protocol != 'none' else None,
+            'obfs_config': obfs_config,
+            'on_output': lambda line: self._post_ssh_output(profile_name, line),
+            'use_asyncssh': profile.get('use_asyncssh', False),
+        }
+    
+    def _post_health_check(self, profile_name, connection, healthy, process, reconnected):
+        """Queue a health check result and wake the Tk main loop (called from health check threads)"""
+        self._health_queue.put((profile_name, connection, healthy, process, reconnected))
+        try:
+            self.root.event_generate('<<HealthCheck>>', when='tail')
+        except (tk.TclError, RuntimeError):
+            # The window has been destroyed while the check was running
+            pass
+    
+    def _on_health_check_event(self, event=None):
+        """Apply queued health check results on the main thread"""
+        while True:
+            try:
+                profile_name, connection, healthy, process, reconnected = self._health_queue.get_nowait()
+            except queue.Empty:
+                return
                 
-                # 处理返回结果：可能是单个进程，也可能是(ssh_process, obfs_protocol_instance)
-                if isinstance(result, tuple):
-                    ssh_process = result[0]
-                    obfs_protocol_instance = result[1]
-                else:
-                    ssh_process = result
-                    obfs_protocol_instance = None
+            if self.active_connections.get(profile_name) is not connection:
+                # 重连完成前用户已断开：新连接无人持有，关闭它
+                if reconnected:
+                    self.ssh_proxy.disconnect(process)
+                continue
                 
-                if ssh_process:
-                    self.active_connections[profile['name']] = {
-                        'ssh_process': ssh_process,
-                        'obfs_protocol_instance': obfs_protocol_instance,
-                        'profile': profile,
-                        'started': datetime.now()
-                    }
-                    
-                    # Update UI from main thread
-                    self.root.after(0, lambda: self.update_connection_status(profile['name'], True))
-            except Exception as e:
-                # Update UI from main thread
-                self.root.after(0, lambda: self.handle_connection_error(profile['name'], str(e)))
-        
-        thread = threading.Thread(target=connect_thread)
-        thread.daemon = True
-        thread.start()
+            if reconnected:
+                # 之后的断开和退出清理都要作用于新连接
+                ssh_process, obfs_protocol_instance = (
+                    process if isinstance(process, tuple) else (process, None))
+                connection['ssh_process'] = ssh_process
+                connection['obfs_protocol_instance'] = obfs_protocol_instance
+                self.update_status(f"Reconnected {profile_name}")
+            elif not healthy:
+                self.update_status(f"Connection to {profile_name} lost, reconnecting...")
     
     def disconnect_profile(self):
         """Disconnect the selected SSH profile"""
-        if not self.profile_listbox.curselection():
+        index = self._selected_index
+        if index is None:
             messagebox.showinfo("Info", "Please select a profile to disconnect.")
             return
             
-        index = self.profile_listbox.curselection()[0]
         profile = self.profiles[index]
         
         # Check if connected
@@ -366,21 +605,33 @@ class SSHDynamicProxyApp:
             return
             
         # Terminate the SSH and obfs processes
-        connection = self.active_connections[profile['name']]
-        self.ssh_proxy.disconnect(
-            connection['ssh_process'], 
-            connection.get('obfs_protocol_instance')
-        )
-        
-        # Remove from active connections
-        del self.active_connections[profile['name']]
+        self.disconnect_profile_by_name(profile['name'])
         
         # Update UI
         self.update_connection_status(profile['name'], False)
     
+    def _post_ssh_output(self, profile_name, line):
+        """Queue a line of SSH stderr and wake the Tk main loop (called from reader threads)"""
+        self._output_queue.put(f"[{profile_name}] {line}")
+        try:
+            self.root.event_generate('<<SSHOutput>>', when='tail')
+        except (tk.TclError, RuntimeError):
+            # The window has been destroyed while ssh was still writing
+            pass
+    
+    def _on_ssh_output_event(self, event=None):
+        """Move queued SSH stderr lines into the status area"""
+        while True:
+            try:
+                message = self._output_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.update_status(message)
+    
     def update_connection_status(self, profile_name, is_connected):
         """更新连接状态UI"""
         if is_connected:
+            # 取连接自身的配置：连接期间配置可能已被改名或删除
             port = self.active_connections[profile_name]['profile']['local_port']
             self.update_status(f"已连接到 {profile_name}。SOCKS5代理地址: socks5://127.0.0.1:{port}")
             # 更新状态指示器和SOCKS5标签
@@ -394,9 +645,8 @@ class SSHDynamicProxyApp:
                 self.socks5_label.config(text="SOCKS5: 未连接")
             
         # 更新按钮状态（如果当前选中此配置文件）
-        if self.profile_listbox.curselection():
-            index = self.profile_listbox.curselection()[0]
-            selected_profile = self.profiles[index]
+        if self._selected_index is not None:
+            selected_profile = self.profiles[self._selected_index]
             
             if selected_profile['name'] == profile_name:
                 if is_connected:
@@ -416,10 +666,11 @@ class SSHDynamicProxyApp:
             from PIL import Image, ImageDraw
             import pystray
             
-            # Create tray icon image
-            image = Image.new('RGB', (64, 64), 'black')
-            dc = ImageDraw.Draw(image)
-            dc.rectangle((16, 16, 48, 48), fill='green')
+            # Create both tray icon images once; update_tray_icon just swaps them
+            self._tray_img_on = Image.new('RGB', (64, 64), 'black')
+            ImageDraw.Draw(self._tray_img_on).rectangle((16, 16, 48, 48), fill='green')
+            self._tray_img_off = Image.new('RGB', (64, 64), 'black')
+            ImageDraw.Draw(self._tray_img_off).rectangle((16, 16, 48, 48), fill='gray')
             
             # Create menu
             menu = pystray.Menu(
@@ -428,7 +679,7 @@ class SSHDynamicProxyApp:
             )
             
             # Create tray icon
-            self.tray = pystray.Icon("SSHProxy", image, "SSH动态代理", menu)
+            self.tray = pystray.Icon("SSHProxy", self._tray_img_on, "SSH动态代理", menu)
             
             # Start tray in separate thread
             threading.Thread(target=self.tray.run, daemon=True).start()
@@ -451,6 +702,10 @@ class SSHDynamicProxyApp:
         for name in list(self.active_connections.keys()):
             self.disconnect_profile_by_name(name)
             
+        self._flush_profiles()
+            
+        self._executor.shutdown(wait=False, cancel_futures=True)
+            
         # Close application
         self.root.destroy()
         if hasattr(self, 'tray'):
@@ -458,30 +713,55 @@ class SSHDynamicProxyApp:
             
     def disconnect_profile_by_name(self, profile_name):
         """Disconnect profile by name"""
-        if profile_name in self.active_connections:
-            connection = self.active_connections[profile_name]
-            self.ssh_proxy.disconnect(connection['process'])
-            del self.active_connections[profile_name]
+        connection = self.active_connections.pop(profile_name, None)
+        if connection is None:
+            return
+            
+        self.ssh_proxy.disconnect(
+            connection['ssh_process'], 
+            connection.get('obfs_protocol_instance'),
+            connection.get('health_check')
+        )
+            
+    def _reap_all(self):
+        """Terminate all child processes and release their pipes (registered with atexit)"""
+        # SIGTERM 等退出路径不经过 quit_app，先保存尚未写入的配置修改
+        self._flush_profiles()
+        while self.active_connections:
+            _, connection = self.active_connections.popitem()
+            ssh_process = connection['ssh_process']
+            try:
+                self.ssh_proxy.disconnect(
+                    ssh_process, 
+                    connection.get('obfs_protocol_instance'),
+                    connection.get('health_check')
+                )
+            finally:
+                # Same cleanup as Popen.__exit__: close pipes, then reap
+                for stream in (ssh_process.stdin, ssh_process.stdout, ssh_process.stderr):
+                    if stream:
+                        stream.close()
+                if ssh_process.poll() is None:
+                    ssh_process.kill()
+                ssh_process.wait()
+                
+    def _on_terminate_signal(self, signum, frame):
+        """Turn termination signals into a normal exit so atexit handlers run"""
+        logger.info("Received signal %s, shutting down", signum)
+        sys.exit(0)
             
     def update_tray_icon(self):
         """Update tray icon based on connection status"""
         if not hasattr(self, 'tray'):
             return
             
-        from PIL import Image, ImageDraw
-        
-        # Create new icon
-        color = 'green' if self.active_connections else 'gray'
-        image = Image.new('RGB', (64, 64), 'black')
-        dc = ImageDraw.Draw(image)
-        dc.rectangle((16, 16, 48, 48), fill=color)
-        
         # Update tray icon
-        self.tray.icon = image
+        self.tray.icon = self._tray_img_on if self.active_connections else self._tray_img_off
         self.tray.title = f"SSH动态代理 ({len(self.active_connections)}个活动连接)"
         
     def on_closing(self):
         """Handle window closing event - always minimize to tray"""
+        self._flush_profiles()
         self.hide_app()
     
     def handle_connection_error(self, profile_name, error_msg):
@@ -490,12 +770,30 @@ class SSHDynamicProxyApp:
         messagebox.showerror("Connection Error", f"Failed to connect to {profile_name}:\n{error_msg}")
     
     def update_status(self, message):
-        """Update the status text area with a timestamped message"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        status_msg = f"[{timestamp}] {message}\n"
+        """Queue a timestamped message for the status text area"""
+        timestamp = strftime("%H:%M:%S", localtime())
+        self._status_buf.append(f"[{timestamp}] {message}\n")
+        
+        # Coalesce bursts of messages into one widget update per idle cycle
+        if not self._status_pending:
+            self._status_pending = True
+            self.root.after_idle(self._flush_status)
+    
+    def _flush_status(self):
+        """Write all queued status messages to the status text area at once"""
+        self._status_pending = False
+        if not self._status_buf:
+            return
+            
+        joined = "".join(self._status_buf)
+        self._status_buf.clear()
         
         self.status_text.config(state=tk.NORMAL)
-        self.status_text.insert(tk.END, status_msg)
+        self.status_text.insert(tk.END, joined)
+        # Keep only the most recent lines to bound widget memory
+        line_count = int(self.status_text.index("end-1c").split(".")[0])
+        if line_count > MAX_STATUS_LINES:
+            self.status_text.delete("1.0", f"{line_count - MAX_STATUS_LINES}.0")
         self.status_text.see(tk.END)  # Scroll to the end
         self.status_text.config(state=tk.DISABLED)
     
@@ -506,7 +804,8 @@ class SSHDynamicProxyApp:
             filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
         )
         if file_path:
-            if self.config.import_profiles(file_path):
+            self._flush_profiles()
+            if self.config.import_profiles(file_path, existing_profiles=self.profiles):
                 self.profiles = self.config.load_profiles()
                 self.load_profiles_to_listbox()
                 self.update_status(f"Profiles imported from {file_path}")
@@ -521,6 +820,8 @@ class SSHDynamicProxyApp:
             filetypes=[("JSON files", "*.json")]
         )
         if file_path:
+            # 导出的是磁盘上的文件，先写入未保存的修改
+            self._flush_profiles()
             if self.config.export_profiles(file_path):
                 self.update_status(f"Profiles exported to {file_path}")
             else:
@@ -528,6 +829,12 @@ class SSHDynamicProxyApp:
     
     def show_documentation(self):
         """Show the documentation"""
+        # 复用已创建的文档窗口
+        if self._doc_window is not None and self._doc_window.winfo_exists():
+            self._doc_window.deiconify()
+            self._doc_window.lift()
+            return
+            
         doc_text = """
 SSH Dynamic Proxy Tool Documentation
 
@@ -555,11 +862,15 @@ For more information, visit the project website.
         doc_window = tk.Toplevel(self.root)
         doc_window.title("Documentation")
         doc_window.geometry("500x400")
+        # 关闭时只隐藏，下次直接显示
+        doc_window.protocol("WM_DELETE_WINDOW", doc_window.withdraw)
         
         text = tk.Text(doc_window, wrap=tk.WORD, padx=10, pady=10)
         text.pack(fill=tk.BOTH, expand=True)
         text.insert(tk.END, doc_text)
         text.config(state=tk.DISABLED)
+        
+        self._doc_window = doc_window
     
     def show_about(self):
         """Show the about dialog"""
@@ -578,6 +889,31 @@ multiple traffic obfuscation protocols (Obfs4, Stunnel, Shadowsocks, V2Ray).
 
 class ProfileDialog:
     """Dialog for creating or editing SSH profiles"""
+    # Default value of every profile field shown in the dialog
+    DEFAULTS = {
+        'name': "",
+        'host': "",
+        'port': 22,
+        'username': "",
+        'key_path': "",
+        'local_port': 1080,
+        'obfs_protocol': 'none',
+        'use_asyncssh': False,
+        'description': "",
+        **{field: default
+           for fields in OBFS_FIELD_MAP.values()
+           for _, field, default in fields},
+    }
+    # (width, height) of the screen, looked up once for center_dialog
+    _screen_size = None
+    # File type filters for browse_key
+    _KEY_FILETYPES = (
+        ("All Files", "*.*"),
+        ("Private Key Files", "*.pem *.ppk *.key"),
+        ("OpenSSH Private Key", "*.pem"),
+        ("PuTTY Private Key", "*.ppk"),
+    )
+    
     def __init__(self, parent, title, profile=None):
         self.result = None
         
@@ -589,13 +925,10 @@ class ProfileDialog:
         self.dialog.transient(parent)
         self.dialog.grab_set()
         
-        # Center the dialog
-        self.dialog.update_idletasks()
-        width = self.dialog.winfo_width()
-        height = self.dialog.winfo_height()
-        x = (self.dialog.winfo_screenwidth() // 2) - (width // 2)
-        y = (self.dialog.winfo_screenheight() // 2) - (height // 2)
-        self.dialog.geometry(f"{width}x{height}+{x}+{y}")
+        # Last size applied by _set_geometry (create_form sizes and centers the dialog)
+        self._last_geom = None
+        # Profile fields merged over the defaults, also used when creating a new profile
+        self._fields = {**self.DEFAULTS, **(profile or {})}
         
         # Create form
         self.create_form(profile)
@@ -605,32 +938,29 @@ class ProfileDialog:
     
     def create_form(self, profile):
         """Create the profile form"""
+        fields = self._fields
         frame = ttk.Frame(self.dialog, padding="10")
         frame.pack(fill=tk.BOTH, expand=True)
         
         # Profile name
-        ttk.Label(frame, text="Profile Name:").grid(row=0, column=0, sticky=tk.W, pady=5)
-        self.name_var = tk.StringVar(value=profile['name'] if profile else "")
-        ttk.Entry(frame, textvariable=self.name_var, width=30).grid(row=0, column=1, sticky=tk.W+tk.E, pady=5)
+        self.name_var = tk.StringVar(value=fields['name'])
+        self._row(frame, 0, "Profile Name:", self.name_var, pady=5, width=30)
         
         # Host
-        ttk.Label(frame, text="SSH Host:").grid(row=1, column=0, sticky=tk.W, pady=5)
-        self.host_var = tk.StringVar(value=profile['host'] if profile else "")
-        ttk.Entry(frame, textvariable=self.host_var, width=30).grid(row=1, column=1, sticky=tk.W+tk.E, pady=5)
+        self.host_var = tk.StringVar(value=fields['host'])
+        self._row(frame, 1, "SSH Host:", self.host_var, pady=5, width=30)
         
         # Port
-        ttk.Label(frame, text="SSH Port:").grid(row=2, column=0, sticky=tk.W, pady=5)
-        self.port_var = tk.StringVar(value=str(profile['port']) if profile else "22")
-        ttk.Entry(frame, textvariable=self.port_var, width=10).grid(row=2, column=1, sticky=tk.W, pady=5)
+        self.port_var = tk.StringVar(value=str(fields['port']))
+        self._row(frame, 2, "SSH Port:", self.port_var, sticky=tk.W, pady=5, width=10)
         
         # Username
-        ttk.Label(frame, text="Username:").grid(row=3, column=0, sticky=tk.W, pady=5)
-        self.username_var = tk.StringVar(value=profile['username'] if profile else "")
-        ttk.Entry(frame, textvariable=self.username_var, width=30).grid(row=3, column=1, sticky=tk.W+tk.E, pady=5)
+        self.username_var = tk.StringVar(value=fields['username'])
+        self._row(frame, 3, "Username:", self.username_var, pady=5, width=30)
         
         # Authentication method
         ttk.Label(frame, text="Authentication:").grid(row=4, column=0, sticky=tk.W, pady=5)
-        self.auth_var = tk.StringVar(value="key" if profile and profile.get('key_path') else "password")
+        self.auth_var = tk.StringVar(value="key" if fields['key_path'] else "password")
         
         auth_frame = ttk.Frame(frame)
         auth_frame.grid(row=4, column=1, sticky=tk.W, pady=5)
@@ -642,24 +972,23 @@ class ProfileDialog:
         
         # Key path
         self.key_frame = ttk.Frame(frame)
-        self.key_frame.grid(row=5, column=0, columnspan=2, sticky=tk.W+tk.E, pady=5)
+        self.key_frame.grid(row=5, column=0, columnspan=2, sticky=STICKY_WE, pady=5)
         
         ttk.Label(self.key_frame, text="Key File Path:").pack(side=tk.LEFT, padx=(0, 5))
-        self.key_path_var = tk.StringVar(value=profile.get('key_path', "") if profile else "")
+        self.key_path_var = tk.StringVar(value=fields['key_path'])
         ttk.Entry(self.key_frame, textvariable=self.key_path_var, width=30).pack(side=tk.LEFT, expand=True, fill=tk.X)
         ttk.Button(self.key_frame, text="Browse...", command=self.browse_key).pack(side=tk.LEFT, padx=(5, 0))
         
         # Local port
-        ttk.Label(frame, text="Local Port:").grid(row=6, column=0, sticky=tk.W, pady=5)
-        self.local_port_var = tk.StringVar(value=str(profile['local_port']) if profile else "1080")
-        ttk.Entry(frame, textvariable=self.local_port_var, width=10).grid(row=6, column=1, sticky=tk.W, pady=5)
+        self.local_port_var = tk.StringVar(value=str(fields['local_port']))
+        self._row(frame, 6, "Local Port:", self.local_port_var, sticky=tk.W, pady=5, width=10)
         
         # Traffic Obfuscation Section
         obfs_section = ttk.LabelFrame(frame, text="Traffic Obfuscation", padding=5)
-        obfs_section.grid(row=7, column=0, columnspan=2, sticky=tk.W+tk.E, pady=5)
+        obfs_section.grid(row=7, column=0, columnspan=2, sticky=STICKY_WE, pady=5)
         
         # Protocol selection
-        self.obfs_protocol_var = tk.StringVar(value=profile.get('obfs_protocol', 'none') if profile else 'none')
+        self.obfs_protocol_var = tk.StringVar(value=fields['obfs_protocol'])
         
         protocol_frame = ttk.Frame(obfs_section)
         protocol_frame.pack(fill=tk.X, pady=5)
@@ -676,201 +1005,229 @@ class ProfileDialog:
         ttk.Radiobutton(protocol_frame, text="V2Ray", variable=self.obfs_protocol_var, 
                        value="v2ray", command=self.toggle_obfs_fields).pack(side=tk.LEFT)
         
-        # Obfs4 fields container (initially hidden)
-        self.obfs4_fields_frame = ttk.Frame(obfs_section)
+        # Help text
+        self._obfs_help = ttk.Label(obfs_section, 
+                            text=OBFS_HELP_TEXT,
+                            font=FONT_UI_8,
+                            foreground="#666",
+                            justify=tk.LEFT)
+        self._obfs_help.pack(anchor=tk.W, pady=(5,0), fill=tk.X)
+        
+        # 各协议的字段区域在首次选中时才创建
+        self._obfs_section = obfs_section
+        self._obfs_frames = {}
+        self._current_obfs_frame = None
+        self._obfs_builders = {
+            'obfs4': self._build_obfs4_fields,
+            'stunnel': self._build_stunnel_fields,
+            'shadowsocks': self._build_shadowsocks_fields,
+            'v2ray': self._build_v2ray_fields,
+        }
+        
+        # Initially show/hide based on selection
+        self.toggle_obfs_fields()
+        
+        # Built-in SSH client (opt-in: it does not use ~/.ssh/config or the ssh agent setup)
+        self.use_asyncssh_var = tk.BooleanVar(value=fields['use_asyncssh'])
+        ttk.Checkbutton(frame, text="Use built-in SSH client (asyncssh, no obfuscation)",
+                        variable=self.use_asyncssh_var).grid(row=8, column=0, columnspan=2, sticky=tk.W, pady=5)
+        
+        # Adjust dialog size and position
+        self._set_geometry("550x680", center=True)
+        
+        # Make dialog resizable with minimum size
+        self.dialog.resizable(True, True)
+        self.dialog.minsize(550, 580)
+        
+        # Configure grid weights for better resizing
+        frame.grid_rowconfigure(9, weight=1)
+        frame.grid_columnconfigure(1, weight=1)
+        
+        # Description
+        ttk.Label(frame, text="Description:").grid(row=9, column=0, sticky=STICKY_WN, pady=5)
+        self.description_var = tk.Text(frame, width=30, height=4)
+        self.description_var.grid(row=9, column=1, sticky=STICKY_WE, pady=5)
+        if fields['description']:
+            self.description_var.insert(tk.END, fields['description'])
+        
+        # Buttons
+        button_frame = ttk.Frame(frame)
+        button_frame.grid(row=10, column=0, columnspan=2, pady=10)
+        
+        ttk.Button(button_frame, text="Save", command=self.save).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Cancel", command=self.cancel).pack(side=tk.LEFT, padx=5)
+        
+        # Initial state of key path frame
+        self.toggle_key_path()
+    
+    def toggle_key_path(self):
+        """Show or hide the key path field based on authentication method"""
+        if self.auth_var.get() == "key":
+            self.key_frame.grid()
+        else:
+            self.key_frame.grid_remove()
+    
+    def _row(self, parent, row, label, var, sticky=STICKY_WE, pady=2, **entry_kw):
+        """Grid a label and an entry bound to var into one form row"""
+        ttk.Label(parent, text=label).grid(row=row, column=0, sticky=tk.W, pady=pady)
+        entry = ttk.Entry(parent, textvariable=var, **entry_kw)
+        entry.grid(row=row, column=1, sticky=sticky, pady=pady)
+        return entry
+    
+    def _build_obfs4_fields(self):
+        """Create the Obfs4 fields frame"""
+        fields = self._fields
+        frame = ttk.Frame(self._obfs_section)
         
         # Bridge address
-        bridge_frame = ttk.Frame(self.obfs4_fields_frame)
+        bridge_frame = ttk.Frame(frame)
         bridge_frame.pack(fill=tk.X, pady=5)
         
         ttk.Label(bridge_frame, text="Bridge Address:").pack(side=tk.LEFT, padx=(0,5))
-        self.obfs_bridge_var = tk.StringVar(value=profile.get('obfs_bridge', '') if profile else '')
+        self.obfs_bridge_var = tk.StringVar(value=fields['obfs_bridge'])
         bridge_entry = ttk.Entry(bridge_frame, textvariable=self.obfs_bridge_var)
         bridge_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
         
         # Certificate
-        cert_frame = ttk.Frame(self.obfs4_fields_frame)
+        cert_frame = ttk.Frame(frame)
         cert_frame.pack(fill=tk.X, pady=5)
         
         ttk.Label(cert_frame, text="Certificate:").pack(side=tk.LEFT, padx=(0,5))
-        self.obfs_cert_var = tk.StringVar(value=profile.get('obfs_cert', '') if profile else '')
+        self.obfs_cert_var = tk.StringVar(value=fields['obfs_cert'])
         cert_entry = ttk.Entry(cert_frame, textvariable=self.obfs_cert_var)
         cert_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
-
-        # Stunnel fields container (initially hidden)
-        self.stunnel_fields_frame = ttk.Frame(obfs_section)
+        
+        return frame
+    
+    def _build_stunnel_fields(self):
+        """Create the Stunnel fields frame"""
+        fields = self._fields
+        frame = ttk.Frame(self._obfs_section)
         
         # Stunnel configuration
-        stunnel_config_frame = ttk.LabelFrame(self.stunnel_fields_frame, text="Stunnel Configuration", padding=5)
+        stunnel_config_frame = ttk.LabelFrame(frame, text="Stunnel Configuration", padding=5)
         stunnel_config_frame.pack(fill=tk.X, pady=5)
         
         # Local port
-        ttk.Label(stunnel_config_frame, text="Local Port:").grid(row=0, column=0, sticky=tk.W, pady=2)
-        self.stunnel_local_port_var = tk.StringVar(value=profile.get('stunnel_local_port', '1081') if profile else '1081')
-        ttk.Entry(stunnel_config_frame, textvariable=self.stunnel_local_port_var, width=10).grid(row=0, column=1, sticky=tk.W, pady=2)
+        self.stunnel_local_port_var = tk.StringVar(value=fields['stunnel_local_port'])
+        self._row(stunnel_config_frame, 0, "Local Port:", self.stunnel_local_port_var, sticky=tk.W, width=10)
         
         # Remote server
-        ttk.Label(stunnel_config_frame, text="Remote Server:").grid(row=1, column=0, sticky=tk.W, pady=2)
-        self.stunnel_remote_var = tk.StringVar(value=profile.get('stunnel_remote', '') if profile else '')
-        ttk.Entry(stunnel_config_frame, textvariable=self.stunnel_remote_var, width=30).grid(row=1, column=1, sticky=tk.W+tk.E, pady=2)
+        self.stunnel_remote_var = tk.StringVar(value=fields['stunnel_remote'])
+        self._row(stunnel_config_frame, 1, "Remote Server:", self.stunnel_remote_var, width=30)
         
         # Verify certificate
-        self.stunnel_verify_var = tk.BooleanVar(value=profile.get('stunnel_verify', False) if profile else False)
+        self.stunnel_verify_var = tk.BooleanVar(value=fields['stunnel_verify'])
         ttk.Checkbutton(stunnel_config_frame, text="Verify Certificate", 
                        variable=self.stunnel_verify_var).grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=2)
         
         # Additional options
-        ttk.Label(stunnel_config_frame, text="Extra Options:").grid(row=3, column=0, sticky=tk.W, pady=2)
-        self.stunnel_options_var = tk.StringVar(value=profile.get('stunnel_options', '') if profile else '')
-        ttk.Entry(stunnel_config_frame, textvariable=self.stunnel_options_var).grid(row=3, column=1, sticky=tk.W+tk.E, pady=2)
+        self.stunnel_options_var = tk.StringVar(value=fields['stunnel_options'])
+        self._row(stunnel_config_frame, 3, "Extra Options:", self.stunnel_options_var)
         
         # Test connection button
-        ttk.Button(stunnel_config_frame, text="Test Configuration", 
-                  command=self.test_stunnel_config).grid(row=4, column=0, columnspan=2, pady=5)
-
-        # Shadowsocks fields container (initially hidden)
-        self.shadowsocks_fields_frame = ttk.Frame(obfs_section)
+        self._stunnel_test_btn = ttk.Button(stunnel_config_frame, text="Test Configuration", 
+                                            command=self.test_stunnel_config)
+        self._stunnel_test_btn.grid(row=4, column=0, columnspan=2, pady=5)
+        
+        return frame
+    
+    def _build_shadowsocks_fields(self):
+        """Create the Shadowsocks fields frame"""
+        fields = self._fields
+        frame = ttk.Frame(self._obfs_section)
         
         # Shadowsocks configuration
-        ss_config_frame = ttk.LabelFrame(self.shadowsocks_fields_frame, text="Shadowsocks Configuration", padding=5)
+        ss_config_frame = ttk.LabelFrame(frame, text="Shadowsocks Configuration", padding=5)
         ss_config_frame.pack(fill=tk.X, pady=5)
         
         # Server
-        ttk.Label(ss_config_frame, text="Server:").grid(row=0, column=0, sticky=tk.W, pady=2)
-        self.ss_server_var = tk.StringVar(value=profile.get('ss_server', '') if profile else '')
-        ttk.Entry(ss_config_frame, textvariable=self.ss_server_var, width=30).grid(row=0, column=1, sticky=tk.W+tk.E, pady=2)
+        self.ss_server_var = tk.StringVar(value=fields['ss_server'])
+        self._row(ss_config_frame, 0, "Server:", self.ss_server_var, width=30)
         
         # Port
-        ttk.Label(ss_config_frame, text="Port:").grid(row=1, column=0, sticky=tk.W, pady=2)
-        self.ss_port_var = tk.StringVar(value=profile.get('ss_port', '8388') if profile else '8388')
-        ttk.Entry(ss_config_frame, textvariable=self.ss_port_var, width=10).grid(row=1, column=1, sticky=tk.W, pady=2)
+        self.ss_port_var = tk.StringVar(value=fields['ss_port'])
+        self._row(ss_config_frame, 1, "Port:", self.ss_port_var, sticky=tk.W, width=10)
         
         # Password
-        ttk.Label(ss_config_frame, text="Password:").grid(row=2, column=0, sticky=tk.W, pady=2)
-        self.ss_password_var = tk.StringVar(value=profile.get('ss_password', '') if profile else '')
-        ttk.Entry(ss_config_frame, textvariable=self.ss_password_var, width=30, show='*').grid(row=2, column=1, sticky=tk.W+tk.E, pady=2)
+        self.ss_password_var = tk.StringVar(value=fields['ss_password'])
+        self._row(ss_config_frame, 2, "Password:", self.ss_password_var, width=30, show='*')
         
         # Encryption method
         ttk.Label(ss_config_frame, text="Method:").grid(row=3, column=0, sticky=tk.W, pady=2)
-        self.ss_method_var = tk.StringVar(value=profile.get('ss_method', 'aes-256-gcm') if profile else 'aes-256-gcm')
-        methods = ['aes-256-gcm', 'aes-128-gcm', 'chacha20-ietf-poly1305', 'aes-256-cfb', 'aes-128-cfb']
-        method_combo = ttk.Combobox(ss_config_frame, textvariable=self.ss_method_var, values=methods, width=20)
-        method_combo.grid(row=3, column=1, sticky=tk.W, pady=2)
+        self.ss_method_var = tk.StringVar(value=fields['ss_method'])
+        method_menu = ttk.OptionMenu(ss_config_frame, self.ss_method_var, self.ss_method_var.get(), *SS_METHODS)
+        method_menu.grid(row=3, column=1, sticky=tk.W, pady=2)
         
-        # V2Ray fields container (initially hidden)
-        self.v2ray_fields_frame = ttk.Frame(obfs_section)
+        return frame
+    
+    def _build_v2ray_fields(self):
+        """Create the V2Ray fields frame"""
+        fields = self._fields
+        frame = ttk.Frame(self._obfs_section)
         
         # V2Ray configuration
-        v2ray_config_frame = ttk.LabelFrame(self.v2ray_fields_frame, text="V2Ray Configuration", padding=5)
+        v2ray_config_frame = ttk.LabelFrame(frame, text="V2Ray Configuration", padding=5)
         v2ray_config_frame.pack(fill=tk.X, pady=5)
         
         # Server
-        ttk.Label(v2ray_config_frame, text="Server:").grid(row=0, column=0, sticky=tk.W, pady=2)
-        self.v2ray_server_var = tk.StringVar(value=profile.get('v2ray_server', '') if profile else '')
-        ttk.Entry(v2ray_config_frame, textvariable=self.v2ray_server_var, width=30).grid(row=0, column=1, sticky=tk.W+tk.E, pady=2)
+        self.v2ray_server_var = tk.StringVar(value=fields['v2ray_server'])
+        self._row(v2ray_config_frame, 0, "Server:", self.v2ray_server_var, width=30)
         
         # Port
-        ttk.Label(v2ray_config_frame, text="Port:").grid(row=1, column=0, sticky=tk.W, pady=2)
-        self.v2ray_port_var = tk.StringVar(value=profile.get('v2ray_port', '1080') if profile else '1080')
-        ttk.Entry(v2ray_config_frame, textvariable=self.v2ray_port_var, width=10).grid(row=1, column=1, sticky=tk.W, pady=2)
+        self.v2ray_port_var = tk.StringVar(value=fields['v2ray_port'])
+        self._row(v2ray_config_frame, 1, "Port:", self.v2ray_port_var, sticky=tk.W, width=10)
         
         # UUID
-        ttk.Label(v2ray_config_frame, text="UUID:").grid(row=2, column=0, sticky=tk.W, pady=2)
-        self.v2ray_uuid_var = tk.StringVar(value=profile.get('v2ray_uuid', '') if profile else '')
-        ttk.Entry(v2ray_config_frame, textvariable=self.v2ray_uuid_var, width=30).grid(row=2, column=1, sticky=tk.W+tk.E, pady=2)
+        self.v2ray_uuid_var = tk.StringVar(value=fields['v2ray_uuid'])
+        self._row(v2ray_config_frame, 2, "UUID:", self.v2ray_uuid_var, width=30)
         
         # Alter ID
-        ttk.Label(v2ray_config_frame, text="Alter ID:").grid(row=3, column=0, sticky=tk.W, pady=2)
-        self.v2ray_alter_id_var = tk.StringVar(value=profile.get('v2ray_alter_id', '0') if profile else '0')
-        ttk.Entry(v2ray_config_frame, textvariable=self.v2ray_alter_id_var, width=10).grid(row=3, column=1, sticky=tk.W, pady=2)
+        self.v2ray_alter_id_var = tk.StringVar(value=fields['v2ray_alter_id'])
+        self._row(v2ray_config_frame, 3, "Alter ID:", self.v2ray_alter_id_var, sticky=tk.W, width=10)
         
         # Security
         ttk.Label(v2ray_config_frame, text="Security:").grid(row=4, column=0, sticky=tk.W, pady=2)
-        self.v2ray_security_var = tk.StringVar(value=profile.get('v2ray_security', 'auto') if profile else 'auto')
-        security_options = ['auto', 'aes-128-gcm', 'chacha20-poly1305', 'none']
-        security_combo = ttk.Combobox(v2ray_config_frame, textvariable=self.v2ray_security_var, values=security_options, width=20)
-        security_combo.grid(row=4, column=1, sticky=tk.W, pady=2)
-
-        # Initially show/hide based on selection
-        self.toggle_obfs_fields()
-        
-        # Adjust dialog size and position
-        self.dialog.geometry("550x650")
-        self.center_dialog()
-        
-        # Make dialog resizable with minimum size
-        self.dialog.resizable(True, True)
-        self.dialog.minsize(550, 550)
-        
-        # Configure grid weights for better resizing
-        frame.grid_rowconfigure(9, weight=1)
-        frame.grid_columnconfigure(1, weight=1)
-        
-        # Add scrollbar functionality
-        self.setup_scrollbar(frame)
+        self.v2ray_security_var = tk.StringVar(value=fields['v2ray_security'])
+        security_menu = ttk.OptionMenu(v2ray_config_frame, self.v2ray_security_var, self.v2ray_security_var.get(), *V2RAY_SECURITY_OPTIONS)
+        security_menu.grid(row=4, column=1, sticky=tk.W, pady=2)
         
-        # Help text
-        help_text = ttk.Label(obfs_section, 
-                            text="Note: Select an obfuscation protocol to bypass network restrictions.\n" +
-                                 "- Obfs4: Get bridge info from Tor Project\n" +
-                                 "- Stunnel: Configure SSL/TLS encryption\n" +
-                                 "- Shadowsocks: Configure server and encryption method\n" +
-                                 "- V2Ray: Configure server and protocol settings",
-                            font=('Segoe UI', 8),
-                            foreground="#666",
-                            justify=tk.LEFT)
-        help_text.pack(anchor=tk.W, pady=(5,0), fill=tk.X)
-        
-        # Description
-        ttk.Label(frame, text="Description:").grid(row=9, column=0, sticky=tk.W+tk.N, pady=5)
-        self.description_var = tk.Text(frame, width=30, height=4)
-        self.description_var.grid(row=9, column=1, sticky=tk.W+tk.E, pady=5)
-        if profile and profile.get('description'):
-            self.description_var.insert(tk.END, profile['description'])
-        
-        # Buttons
-        button_frame = ttk.Frame(frame)
-        button_frame.grid(row=10, column=0, columnspan=2, pady=10)
-        
-        ttk.Button(button_frame, text="Save", command=self.save).pack(side=tk.LEFT, padx=5)
-        ttk.Button(button_frame, text="Cancel", command=self.cancel).pack(side=tk.LEFT, padx=5)
-        
-        # Initial state of key path frame
-        self.toggle_key_path()
-    
-    def toggle_key_path(self):
-        """Show or hide the key path field based on authentication method"""
-        if self.auth_var.get() == "key":
-            self.key_frame.grid()
-        else:
-            self.key_frame.grid_remove()
+        return frame
     
     def toggle_obfs_fields(self):
         """Show or hide the obfs fields based on protocol selection"""
-        # Hide all fields first
-        self.obfs4_fields_frame.pack_forget()
-        self.stunnel_fields_frame.pack_forget()
-        self.shadowsocks_fields_frame.pack_forget()
-        self.v2ray_fields_frame.pack_forget()
-        
-        # Show appropriate fields based on selection
         protocol = self.obfs_protocol_var.get()
-        if protocol == "obfs4":
-            self.obfs4_fields_frame.pack(fill=tk.X, expand=True)
-            self.dialog.geometry("550x650")
-        elif protocol == "stunnel":
-            self.stunnel_fields_frame.pack(fill=tk.X, expand=True)
-            self.dialog.geometry("550x650")
-        elif protocol == "shadowsocks":
-            self.shadowsocks_fields_frame.pack(fill=tk.X, expand=True)
-            self.dialog.geometry("550x650")
-        elif protocol == "v2ray":
-            self.v2ray_fields_frame.pack(fill=tk.X, expand=True)
-            self.dialog.geometry("550x650")
+        obfs_frame = self._obfs_frames.get(protocol)
+        if obfs_frame is None and protocol in self._obfs_builders:
+            # Build the fields on first use
+            obfs_frame = self._obfs_frames[protocol] = self._obfs_builders[protocol]()
+        
+        # Only the currently shown frame needs hiding
+        if obfs_frame is not self._current_obfs_frame:
+            if self._current_obfs_frame is not None:
+                self._current_obfs_frame.pack_forget()
+            if obfs_frame is not None:
+                obfs_frame.pack(fill=tk.X, expand=True, before=self._obfs_help)
+            self._current_obfs_frame = obfs_frame
+        
+        self._set_geometry("550x580" if obfs_frame is None else "550x680")
+    
+    def _set_geometry(self, geometry, center=False):
+        """
+        Resize the dialog, skipping the Tk call when the size is unchanged and no centering is requested
+        
+        Args:
+            geometry: "WIDTHxHEIGHT" string
+            center: Also center the dialog on screen; otherwise it keeps its position
+        """
+        if geometry == self._last_geom and not center:
+            return
+        self._last_geom = geometry
+        if center:
+            width, height = map(int, geometry.split("x"))
+            self.center_dialog(width, height)
         else:
-            self.dialog.geometry("550x550")
-            
-        self.center_dialog()
+            self.dialog.geometry(geometry)
         
     def test_stunnel_config(self):
         """Test the stunnel configuration"""
@@ -879,18 +1236,22 @@ class ProfileDialog:
             if local_port < 1 or local_port > 65535:
                 raise ValueError("Invalid local port")
                 
-            if not self.stunnel_remote_var.get().strip():
+            remote = self.stunnel_remote_var.get().strip()
+            if not remote:
                 raise ValueError("Remote server is required")
                 
             # Generate temporary config file
-            config = f"""
-[ssh-proxy]
-client = yes
-accept = 127.0.0.1:{local_port}
-connect = {self.stunnel_remote_var.get().strip()}
-verifyChain = {'yes' if self.stunnel_verify_var.get() else 'no'}
-{self.stunnel_options_var.get()}
-"""
+            lines = [
+                "[ssh-proxy]",
+                "client = yes",
+                f"accept = 127.0.0.1:{local_port}",
+                f"connect = {remote}",
+                f"verifyChain = {'yes' if self.stunnel_verify_var.get() else 'no'}",
+            ]
+            options = self.stunnel_options_var.get().strip()
+            if options:
+                lines.append(options)
+            config = "\n".join(lines) + "\n"
             
             # Save to temp file
             import tempfile
@@ -898,140 +1259,123 @@ verifyChain = {'yes' if self.stunnel_verify_var.get() else 'no'}
                 f.write(config)
                 temp_path = f.name
                 
-            # Test config
-            result = subprocess.run(["stunnel", "-test", temp_path], capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                messagebox.showinfo("Success", "Stunnel configuration is valid")
-            else:
-                messagebox.showerror("Error", f"Stunnel configuration error:\n{result.stderr}")
+            try:
+                # Test config without blocking the Tk main loop
+                proc = subprocess.Popen(
+                    ["stunnel", "-test", temp_path],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True
+                )
+            except Exception:
+                os.unlink(temp_path)
+                raise
                 
-            # Clean up
-            os.unlink(temp_path)
+            # 测试期间禁用按钮，避免同时启动多个stunnel
+            self._stunnel_test_btn.config(state=tk.DISABLED)
+            self.dialog.after(50, self._poll_stunnel_test, proc, temp_path)
             
         except ValueError as e:
             messagebox.showerror("Error", str(e))
         except Exception as e:
             messagebox.showerror("Error", f"Failed to test stunnel config: {str(e)}")
 
-    def save(self):
-        """Save the profile data"""
-        # Validate inputs
-        if not self.name_var.get().strip():
-            messagebox.showerror("Error", "Profile name is required.")
-            return
-            
-        if not self.host_var.get().strip():
-            messagebox.showerror("Error", "SSH host is required.")
+    def _poll_stunnel_test(self, proc, temp_path):
+        """Poll the running stunnel -test and report the result once it exits"""
+        if proc.poll() is None:
+            self.dialog.after(50, self._poll_stunnel_test, proc, temp_path)
             return
             
-        if not self.username_var.get().strip():
-            messagebox.showerror("Error", "Username is required.")
-            return
-            
-        try:
-            port = int(self.port_var.get())
-            if port < 1 or port > 65535:
-                raise ValueError()
-        except ValueError:
-            messagebox.showerror("Error", "SSH port must be a valid number between 1 and 65535.")
+        _, stderr = proc.communicate()
+        # Clean up (stunnel must be able to reopen the file, so it is not deleted on close)
+        os.unlink(temp_path)
+        
+        # 对话框可能已在测试期间关闭
+        if not self.dialog.winfo_exists():
             return
+        self._stunnel_test_btn.config(state=tk.NORMAL)
+        if proc.returncode == 0:
+            messagebox.showinfo("Success", "Stunnel configuration is valid", parent=self.dialog)
+        else:
+            messagebox.showerror("Error", f"Stunnel configuration error:\n{stderr}", parent=self.dialog)
+
+    def save(self):
+        """Save the profile data"""
+        # Validate inputs, reading each Tk variable only once
+        values = {}
+        for key, label, var in (('name', "Profile name", self.name_var),
+                                ('host', "SSH host", self.host_var),
+                                ('username', "Username", self.username_var)):
+            values[key] = var.get().strip()
+            if not values[key]:
+                messagebox.showerror("Error", f"{label} is required.")
+                return
             
-        try:
-            local_port = int(self.local_port_var.get())
-            if local_port < 1 or local_port > 65535:
-                raise ValueError()
-        except ValueError:
-            messagebox.showerror("Error", "Local port must be a valid number between 1 and 65535.")
-            return
+        for key, label, var in (('port', "SSH port", self.port_var),
+                                ('local_port', "Local port", self.local_port_var)):
+            try:
+                values[key] = int(var.get())
+                if values[key] < 1 or values[key] > 65535:
+                    raise ValueError()
+            except ValueError:
+                messagebox.showerror("Error", f"{label} must be a valid number between 1 and 65535.")
+                return
             
-        if self.auth_var.get() == "key" and not self.key_path_var.get().strip():
+        auth = self.auth_var.get()
+        key_path = self.key_path_var.get().strip()
+        if auth == "key" and not key_path:
             messagebox.showerror("Error", "Key file path is required when using key authentication.")
             return
             
         # Create profile data
         self.result = {
-            'name': self.name_var.get().strip(),
-            'host': self.host_var.get().strip(),
-            'port': port,
-            'username': self.username_var.get().strip(),
-            'local_port': local_port,
-            'description': self.description_var.get("1.0", tk.END).strip()
+            'name': values['name'],
+            'host': values['host'],
+            'port': values['port'],
+            'username': values['username'],
+            'local_port': values['local_port'],
+            'description': self.description_var.get("1.0", "end-1c").strip()
         }
         
-        if self.auth_var.get() == "key":
-            self.result['key_path'] = self.key_path_var.get().strip()
+        if auth == "key":
+            self.result['key_path'] = key_path
+        if self.use_asyncssh_var.get():
+            self.result['use_asyncssh'] = True
         
-        # Add obfs data based on selected protocol
+        # Add obfs data based on selected protocol; each field has a matching <field>_var
         protocol = self.obfs_protocol_var.get()
-        if protocol == "obfs4":
-            self.result['obfs_protocol'] = 'obfs4'
-            self.result['obfs_bridge'] = self.obfs_bridge_var.get().strip()
-            self.result['obfs_cert'] = self.obfs_cert_var.get().strip()
-        elif protocol == "stunnel":
-            self.result['obfs_protocol'] = 'stunnel'
-            self.result['stunnel_local_port'] = self.stunnel_local_port_var.get().strip()
-            self.result['stunnel_remote'] = self.stunnel_remote_var.get().strip()
-            self.result['stunnel_verify'] = self.stunnel_verify_var.get()
-            self.result['stunnel_options'] = self.stunnel_options_var.get().strip()
-        elif protocol == "shadowsocks":
-            self.result['obfs_protocol'] = 'shadowsocks'
-            self.result['ss_server'] = self.ss_server_var.get().strip()
-            self.result['ss_port'] = self.ss_port_var.get().strip()
-            self.result['ss_password'] = self.ss_password_var.get().strip()
-            self.result['ss_method'] = self.ss_method_var.get().strip()
-        elif protocol == "v2ray":
-            self.result['obfs_protocol'] = 'v2ray'
-            self.result['v2ray_server'] = self.v2ray_server_var.get().strip()
-            self.result['v2ray_port'] = self.v2ray_port_var.get().strip()
-            self.result['v2ray_uuid'] = self.v2ray_uuid_var.get().strip()
-            self.result['v2ray_alter_id'] = self.v2ray_alter_id_var.get().strip()
-            self.result['v2ray_security'] = self.v2ray_security_var.get().strip()
+        if protocol in OBFS_FIELD_MAP:
+            self.result['obfs_protocol'] = protocol
+            for _, field, _ in OBFS_FIELD_MAP[protocol]:
+                value = getattr(self, f"{field}_var").get()
+                self.result[field] = value.strip() if isinstance(value, str) else value
         
         self.dialog.destroy()
         
-    def setup_scrollbar(self, frame):
-        """Setup scrollbar for the dialog"""
-        canvas = tk.Canvas(frame)
-        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=canvas.yview)
-        scrollable_frame = ttk.Frame(canvas)
-        
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
+    def center_dialog(self, width=None, height=None):
+        """
+        Center the dialog on screen
         
-        def check_scroll(event):
-            if scrollable_frame.winfo_reqheight() > canvas.winfo_height():
-                scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-            else:
-                scrollbar.pack_forget()
-        
-        canvas.bind("<Configure>", check_scroll)
-        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-    def center_dialog(self):
-        """Center the dialog on screen"""
-        self.dialog.update_idletasks()
-        width = self.dialog.winfo_width()
-        height = self.dialog.winfo_height()
-        x = (self.dialog.winfo_screenwidth() // 2) - (width // 2)
-        y = (self.dialog.winfo_screenheight() // 2) - (height // 2)
+        Args:
+            width: Dialog width; queried from Tk (after an idle-task flush) when omitted
+            height: Dialog height; queried from Tk when omitted
+        """
+        if width is None or height is None:
+            self.dialog.update_idletasks()
+            width = self.dialog.winfo_width()
+            height = self.dialog.winfo_height()
+        if ProfileDialog._screen_size is None:
+            ProfileDialog._screen_size = (self.dialog.winfo_screenwidth(), self.dialog.winfo_screenheight())
+        screen_width, screen_height = ProfileDialog._screen_size
+        x = (screen_width // 2) - (width // 2)
+        y = (screen_height // 2) - (height // 2)
         self.dialog.geometry(f"{width}x{height}+{x}+{y}")
     
     def browse_key(self):
         """Browse for SSH key file"""
         file_path = filedialog.askopenfilename(
             title="Select SSH Private Key",
-            filetypes=[
-                ("All Files", "*.*"),
-                ("Private Key Files", "*.pem *.ppk *.key"),
-                ("OpenSSH Private Key", "*.pem"),
-                ("PuTTY Private Key", "*.ppk")
-            ]
+            filetypes=self._KEY_FILETYPES
         )
         
         if file_path:
@@ -1047,19 +1391,52 @@ verifyChain = {'yes' if self.stunnel_verify_var.get() else 'no'}
 import socket
 import sys
 
+# Held for the life of the process so the single-instance lock is not released by GC
+_INSTANCE_LOCK = None
+
 def check_single_instance(port=18888):
-    """检查是否已有实例运行"""
-    try:
+    """
+    检查是否已有实例运行
+    
+    Args:
+        port: Loopback TCP port used as the lock where abstract Unix sockets are unavailable
+        
+    Returns:
+        socket.socket: The bound lock socket, or None if another instance holds it
+    """
+    if sys.platform.startswith("linux"):
+        # Linux抽象命名空间Unix套接字：不经过TCP协议栈，进程退出时自动释放
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = "\0sshdynamicproxy"
+    else:
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.bind(("127.0.0.1", port))
-        return True
-    except socket.error:
-        messagebox.showerror("错误", "程序已在运行中")
-        return False
+        address = ("127.0.0.1", port)
+    try:
+        s.bind(address)
+        return s
+    except OSError:
+        s.close()
+        # 此时还没有主窗口，用隐藏的根窗口承载错误提示
+        root = tk.Tk()
+        root.withdraw()
+        messagebox.showerror("错误", "程序已在运行中", parent=root)
+        root.destroy()
+        return None
 
 def main():
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler()
+        ]
+    )
+    
     # 检查是否已有实例运行
-    if not check_single_instance():
+    global _INSTANCE_LOCK
+    _INSTANCE_LOCK = check_single_instance()
+    if _INSTANCE_LOCK is None:
         sys.exit(1)
         
     root = tk.Tk()
@@ -8,19 +8,237 @@
 
 import os
 import sys
+import shlex
 import subprocess
 import socket
 import time
 import logging
 import json
-import random
+import hashlib
+import collections
+import shutil
+import contextlib
+import string
+import tempfile
 import threading
+import concurrent.futures
 from abc import ABC, abstractmethod
 from pathlib import Path
 
+from config import default_config_dir
+
+try:
+    import psutil  # 可选依赖，可同时等待多个进程退出
+except ImportError:
+    psutil = None
+
 # 配置日志
 logger = logging.getLogger("obfuscation")
 
+
+# 脚本目录和用户主目录只解析一次
+_SCRIPT_DIR = Path(__file__).parent.absolute()
+_HOME = Path.home()
+
+
+def _candidate_paths(name, *extra):
+    """
+    生成可执行文件的候选路径：项目目录、PATH、用户目录，再加上平台特定位置
+    
+    Args:
+        name (str): 可执行文件名称（不含扩展名）
+        *extra (str): 额外的候选路径
+        
+    Returns:
+        tuple: 候选路径
+    """
+    return (
+        str(_SCRIPT_DIR / name),  # 项目目录中的可执行文件
+        str(_SCRIPT_DIR / f"{name}.exe"),
+        name,  # 如果在 PATH 中
+        f"{name}.exe",
+        str(_HOME / name),
+        str(_HOME / f"{name}.exe"),
+        str(_HOME / ".local" / "bin" / name),
+        *extra,
+    )
+
+
+_OBFS4_PATHS = _candidate_paths(
+    "obfs4proxy",
+    "C:/Program Files/obfs4proxy/obfs4proxy.exe",
+    "C:/Program Files (x86)/obfs4proxy/obfs4proxy.exe",
+)
+_SS_LOCAL_PATHS = _candidate_paths(
+    "ss-local",
+    "C:/Program Files/Shadowsocks/ss-local.exe",
+    "C:/Program Files (x86)/Shadowsocks/ss-local.exe",
+)
+_V2RAY_PATHS = _candidate_paths(
+    "v2ray",
+    "C:/Program Files/v2ray/v2ray.exe",
+    "C:/Program Files (x86)/v2ray/v2ray.exe",
+)
+_STUNNEL_PATHS = _candidate_paths(
+    "stunnel",
+    "/usr/bin/stunnel",
+    "/usr/local/bin/stunnel",
+    "C:/Program Files/stunnel/stunnel.exe",
+    "C:/Program Files (x86)/stunnel/stunnel.exe",
+)
+
+
+def _find_executable(name, candidate_paths):
+    """
+    查找可执行文件，结果由 ObfuscationFactory 缓存
+    
+    不启动进程，只检查 PATH（Windows 下 shutil.which 会考虑 PATHEXT）和文件权限
+    
+    Args:
+        name (str): 可执行文件名称，用于日志
+        candidate_paths (tuple): 按顺序尝试的候选路径
+        
+    Returns:
+        str: 可执行文件路径，如果未找到则返回 None
+    """
+    for path in candidate_paths:
+        if os.path.dirname(path):
+            if os.path.isfile(path) and os.access(path, os.X_OK):
+                logger.info("Found %s at %s", name, path)
+                return path
+        else:
+            found = shutil.which(path)
+            if found:
+                logger.info("Found %s at %s", name, found)
+                return found
+    return None
+
+
+# Python 创建的文件描述符默认不可继承（PEP 446），无需 close_fds；
+# 关闭后 subprocess 在 Linux/macOS 上可以用 posix_spawn 代替 fork+exec。
+# Windows 上子进程的管道句柄是可继承的，并发启动时会泄漏给其他子进程，保持默认值
+_CLOSE_FDS = os.name == "nt"
+
+
+# 已分配但子进程可能尚未绑定的本地端口
+_port_lock = threading.Lock()
+_reserved_ports = set()
+
+
+# stunnel 配置模板
+_STUNNEL_TPL = string.Template("""\
+; stunnel configuration for SSH Dynamic Proxy
+; Generated by SSHDynamicProxy
+client = yes
+debug = 5
+pid = 
+
+[ssh-proxy]
+accept = 127.0.0.1:$local_port
+connect = $remote
+verifyChain = $verify
+$options
+""")
+
+
+# V2Ray 配置模板，占位符的值必须是已编码的 JSON
+_V2RAY_TPL = string.Template("""\
+{"log": {"loglevel": "warning"},
+ "inbounds": [{"port": $local_port, "listen": "127.0.0.1", "protocol": "socks",
+               "settings": {"udp": true}}],
+ "outbounds": [{"protocol": "vmess",
+                "settings": {"vnext": [{"address": $server, "port": $server_port,
+                                        "users": [{"id": $uuid, "alterId": $alter_id,
+                                                   "security": $security}]}]},
+                "streamSettings": {"network": $network, "security": $tls$transport}}]}
+""")
+
+# 各传输协议的 streamSettings 附加字段
+_V2RAY_TRANSPORT_TPLS = {
+    "ws": string.Template(""", "wsSettings": {"path": $path, "headers": $ws_headers}"""),
+    "http": string.Template(""", "httpSettings": {"path": $path_list, "host": $host_list}"""),
+    "tcp": string.Template(""", "tcpSettings": {"header": {"type": "http", "request": {
+    "version": "1.1", "method": "GET", "path": $path_list,
+    "headers": {"Host": $host_list,
+                "User-Agent": ["Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36"],
+                "Accept-Encoding": ["gzip, deflate"],
+                "Connection": ["keep-alive"],
+                "Pragma": "no-cache"}}}}"""),
+}
+
+
+# 生成的配置文件放在应用配置目录（与 Config 相同）
+_CONFIG_DIR = default_config_dir()
+
+
+def _write_private_config_file(prefix, suffix, data):
+    """
+    为单次启动写入一个唯一命名的配置文件，仅当前用户可读写
+    
+    用于包含凭据或每次启动都不同的配置，由调用方在停止时删除。
+    
+    Args:
+        prefix (str): 文件名前缀
+        suffix (str): 文件扩展名
+        data (bytes): 配置内容
+        
+    Returns:
+        str: 配置文件路径
+    """
+    _CONFIG_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+    fd, config_file = tempfile.mkstemp(prefix=f"{prefix}_", suffix=suffix, dir=_CONFIG_DIR)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return config_file
+
+
+def _write_config_file(prefix, suffix, data):
+    """
+    将配置写入应用配置目录，按内容哈希命名，相同内容的文件直接复用
+    
+    通过临时文件原子替换写入，并发启动时不会读到写了一半的文件。
+    
+    Args:
+        prefix (str): 文件名前缀
+        suffix (str): 文件扩展名
+        data (bytes): 配置内容
+        
+    Returns:
+        str: 配置文件路径
+    """
+    config_file = _CONFIG_DIR / f"{prefix}_{hashlib.sha1(data).hexdigest()[:16]}{suffix}"
+    if not config_file.exists():
+        _write_atomic_bytes(config_file, data)
+    return str(config_file)
+
+
+def _write_atomic_bytes(path, data):
+    """
+    先写入临时文件再原子替换目标文件
+    
+    Args:
+        path (Path): 目标文件路径
+        data (bytes): 文件内容
+    """
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    # mkstemp 以 O_EXCL 创建唯一文件（二进制模式、仅当前用户可读写）
+    fd, tmp_file = tempfile.mkstemp(prefix=f"{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_file, path)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_file)
+        raise
+
+
+def invalidate_executable_cache():
+    """
+    清除可执行文件查找缓存（例如用户安装了新程序后）
+    """
+    ObfuscationFactory._discovered_at = None
+
 class ObfuscationProtocol(ABC):
     """
     混淆协议基类
@@ -37,6 +255,11 @@ class ObfuscationProtocol(ABC):
         self.config = config
         self.process = None
         self.local_port = None
+        # 子进程 stderr 的最后若干行，用于启动失败时的诊断
+        self._stderr_tail = collections.deque(maxlen=50)
+        self._stderr_thread = None
+        # 安装了 psutil 时，spawn 时缓存的 psutil.Process
+        self._ps_process = None
     
     @abstractmethod
     def start(self):
@@ -64,16 +287,187 @@ class ObfuscationProtocol(ABC):
         """
         return self.local_port
     
+    def _spawn(self, cmd):
+        """
+        启动代理子进程，并用后台线程持续读取其 stderr
+        
+        子进程的 stdout 被丢弃；stderr 如果无人读取，管道缓冲区写满后子进程会被阻塞。
+        
+        Args:
+            cmd (list): 命令及参数
+            
+        Returns:
+            subprocess.Popen: 子进程
+        """
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors='replace',
+            close_fds=_CLOSE_FDS
+        )
+        self._ps_process = None
+        if psutil is not None:
+            with contextlib.suppress(psutil.Error):
+                self._ps_process = psutil.Process(process.pid)
+        self._stderr_tail.clear()
+        self._stderr_thread = threading.Thread(
+            target=self._drain_stderr,
+            args=(process.stderr, os.path.basename(cmd[0])),
+            daemon=True
+        )
+        self._stderr_thread.start()
+        return process
+    
+    def _drain_stderr(self, stream, name):
+        """
+        读取子进程 stderr 直到结束，写入调试日志并保留最后若干行
+        
+        Args:
+            stream: 子进程的 stderr 管道
+            name (str): 程序名称，用于日志
+        """
+        with stream:
+            for line in stream:
+                line = line.rstrip()
+                self._stderr_tail.append(line)
+                logger.debug("[%s] %s", name, line)
+    
+    def _wait_ready(self, timeout=5.0, socks=False):
+        """
+        等待代理进程开始监听本地端口
+        
+        Args:
+            timeout (float): 最长等待时间（秒）
+            socks (bool): 是否额外发送 SOCKS5 握手确认协议已就绪
+            
+        Returns:
+            bool: 端口可连接时返回 True；进程退出或超时返回 False
+        """
+        deadline = time.monotonic() + timeout
+        address = ('127.0.0.1', int(self.local_port))
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                return False
+            try:
+                with socket.create_connection(address, timeout=0.05) as conn:
+                    if socks:
+                        # 无认证的 SOCKS5 问候，期望回复 05 xx
+                        conn.settimeout(0.5)
+                        conn.sendall(b"\x05\x01\x00")
+                        if conn.recv(2)[:1] != b"\x05":
+                            raise OSError("unexpected SOCKS5 reply")
+                    return True
+            except OSError:
+                time.sleep(0.02)
+        return False
+    
+    def _log_start_failure(self, name):
+        """
+        记录启动失败原因；进程仍在运行但未就绪时将其停止
+        
+        Args:
+            name (str): 代理名称，用于日志
+        """
+        if self.process.poll() is not None:
+            # 等待读取线程取完剩余输出
+            if self._stderr_thread:
+                self._stderr_thread.join(timeout=1)
+            stderr = "\n".join(self._stderr_tail)
+            logger.error("%s failed to start: %s", name, stderr)
+        else:
+            logger.error("%s did not start listening on port %s", name, self.local_port)
+            self.stop()
+    
+    def _terminate(self, grace=1.0):
+        """
+        终止代理子进程：先 terminate，超过 grace 秒仍未退出再 kill
+        
+        Args:
+            grace (float): 等待进程正常退出的秒数
+        """
+        if psutil is not None:
+            self._terminate_all([self], grace)
+            return
+        
+        process, self.process = self.process, None
+        if process is None:
+            return
+        
+        with contextlib.suppress(ProcessLookupError):
+            process.terminate()
+        try:
+            process.wait(timeout=grace)
+        except subprocess.TimeoutExpired:
+            logger.warning("Process %s did not exit in %ss, killing it", process.pid, grace)
+            with contextlib.suppress(ProcessLookupError):
+                process.kill()
+            with contextlib.suppress(subprocess.TimeoutExpired):
+                process.wait(timeout=0.5)
+    
+    @staticmethod
+    def _terminate_all(protocols, grace=1.0):
+        """
+        用 psutil 终止多个协议的子进程：全部 terminate 后一起等待，超时的再 kill
+        
+        Args:
+            protocols (list): ObfuscationProtocol 实例列表
+            grace (float): 等待进程正常退出的秒数
+        """
+        procs = []
+        for protocol in protocols:
+            process, protocol.process = protocol.process, None
+            ps_process, protocol._ps_process = protocol._ps_process, None
+            if process is None:
+                continue
+            if ps_process is None:
+                # spawn 时进程已经退出，只需回收
+                process.poll()
+                continue
+            procs.append(ps_process)
+        
+        for ps_process in procs:
+            with contextlib.suppress(psutil.NoSuchProcess):
+                ps_process.terminate()
+        _, alive = psutil.wait_procs(procs, timeout=grace)
+        for ps_process in alive:
+            logger.warning("Process %s did not exit in %ss, killing it", ps_process.pid, grace)
+            with contextlib.suppress(psutil.NoSuchProcess):
+                ps_process.kill()
+        psutil.wait_procs(alive, timeout=0.5)
+    
     def _find_available_port(self):
         """
         查找可用的本地端口
         
+        端口在子进程真正绑定之前会被预留，避免并发启动的多个协议拿到同一个端口；
+        调用方在子进程启动后应调用 _release_port 释放预留。
+        
         Returns:
             int: 可用的端口号
         """
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind(('127.0.0.1', 0))
-            return s.getsockname()[1]
+        with _port_lock:
+            while True:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                    # 允许子进程在本套接字关闭后立即绑定同一端口
+                    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                    s.bind(('127.0.0.1', 0))
+                    port = s.getsockname()[1]
+                if port not in _reserved_ports:
+                    _reserved_ports.add(port)
+                    return port
+    
+    @staticmethod
+    def _release_port(port):
+        """
+        释放 _find_available_port 预留的端口
+        
+        Args:
+            port (int): 端口号
+        """
+        with _port_lock:
+            _reserved_ports.discard(port)
 
 
 class Obfs4Protocol(ObfuscationProtocol):
@@ -109,40 +503,7 @@ class Obfs4Protocol(ObfuscationProtocol):
         Returns:
             str: obfs4proxy 可执行文件路径，如果未找到则返回 None
         """
-        # 预设路径
-        # 获取当前脚本所在目录
-        script_dir = Path(__file__).parent.absolute()
-        
-        paths = [
-            str(script_dir / "obfs4proxy"),  # 项目目录中的可执行文件
-            str(script_dir / "obfs4proxy.exe"),
-            "obfs4proxy",  # 如果在 PATH 中
-            "obfs4proxy.exe",
-            str(Path.home() / "obfs4proxy"),
-            str(Path.home() / "obfs4proxy.exe"),
-            str(Path.home() / ".local" / "bin" / "obfs4proxy"),
-            "C:/Program Files/obfs4proxy/obfs4proxy.exe",
-            "C:/Program Files (x86)/obfs4proxy/obfs4proxy.exe"
-        ]
-        
-        # 检查每个路径
-        for path in paths:
-            try:
-                # 尝试运行 obfs4proxy 版本命令
-                result = subprocess.run(
-                    [path, "--version"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    timeout=2
-                )
-                if result.returncode == 0:
-                    logger.info(f"Found obfs4proxy at {path}")
-                    return path
-            except (subprocess.SubprocessError, FileNotFoundError):
-                continue
-        
-        return None
+        return ObfuscationFactory.find_executable("obfs4proxy")
     
     def start(self):
         """
@@ -171,43 +532,30 @@ class Obfs4Protocol(ObfuscationProtocol):
                 f"obfs4://{self.cert}@{self.bridge}?iat-mode={self.iat_mode}"
             ]
             
-            logger.info(f"Starting obfs4proxy: {' '.join(cmd)}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Starting obfs4proxy: %s", shlex.join(cmd))
             
             # 启动进程
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
+            self.process = self._spawn(cmd)
             
             # 等待代理准备就绪
-            time.sleep(1)
-            if self.process.poll() is not None:
-                stdout, stderr = self.process.communicate()
-                logger.error(f"obfs4proxy failed to start: {stderr}")
+            if not self._wait_ready(socks=True):
+                self._log_start_failure("obfs4proxy")
                 return False
             
             return True
         except Exception as e:
-            logger.error(f"Error starting obfs4proxy: {str(e)}")
+            logger.error("Error starting obfs4proxy: %s", e)
             return False
+        finally:
+            # 子进程已绑定端口（或已失败），不再需要预留
+            self._release_port(self.local_port)
     
     def stop(self):
         """
         停止 obfs4proxy 进程
         """
-        if self.process:
-            try:
-                self.process.terminate()
-                self.process.wait(timeout=3)
-            except:
-                try:
-                    self.process.kill()
-                except:
-                    pass
-            finally:
-                self.process = None
+        self._terminate()
 
 
 class ShadowsocksProtocol(ObfuscationProtocol):
@@ -249,40 +597,7 @@ class ShadowsocksProtocol(ObfuscationProtocol):
         Returns:
             str: ss-local 可执行文件路径，如果未找到则返回 None
         """
-        # 预设路径
-        # 获取当前脚本所在目录
-        script_dir = Path(__file__).parent.absolute()
-        
-        paths = [
-            str(script_dir / "ss-local"),  # 项目目录中的可执行文件
-            str(script_dir / "ss-local.exe"),
-            "ss-local",  # 如果在 PATH 中
-            "ss-local.exe",
-            str(Path.home() / "ss-local"),
-            str(Path.home() / "ss-local.exe"),
-            str(Path.home() / ".local" / "bin" / "ss-local"),
-            "C:/Program Files/Shadowsocks/ss-local.exe",
-            "C:/Program Files (x86)/Shadowsocks/ss-local.exe"
-        ]
-        
-        # 检查每个路径
-        for path in paths:
-            try:
-                # 尝试运行 ss-local 版本命令
-                result = subprocess.run(
-                    [path, "-h"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    timeout=2
-                )
-                if result.returncode == 0 or "shadowsocks" in result.stdout.lower() or "shadowsocks" in result.stderr.lower():
-                    logger.info(f"Found ss-local at {path}")
-                    return path
-            except (subprocess.SubprocessError, FileNotFoundError):
-                continue
-        
-        return None
+        return ObfuscationFactory.find_executable("ss-local")
     
     def start(self):
         """
@@ -320,43 +635,31 @@ class ShadowsocksProtocol(ObfuscationProtocol):
                 if self.plugin_opts:
                     cmd.extend(["-G", self.plugin_opts])
             
-            logger.info(f"Starting Shadowsocks: {' '.join([c if i < 6 else '****' for i, c in enumerate(cmd)])}")
+            if logger.isEnabledFor(logging.INFO):
+                # 隐藏密码等敏感参数
+                logger.info("Starting Shadowsocks: %s", shlex.join([c if i < 6 else '****' for i, c in enumerate(cmd)]))
             
             # 启动进程
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
+            self.process = self._spawn(cmd)
             
             # 等待代理准备就绪
-            time.sleep(1)
-            if self.process.poll() is not None:
-                stdout, stderr = self.process.communicate()
-                logger.error(f"Shadowsocks failed to start: {stderr}")
+            if not self._wait_ready(socks=True):
+                self._log_start_failure("Shadowsocks")
                 return False
             
             return True
         except Exception as e:
-            logger.error(f"Error starting Shadowsocks: {str(e)}")
+            logger.error("Error starting Shadowsocks: %s", e)
             return False
+        finally:
+            # 子进程已绑定端口（或已失败），不再需要预留
+            self._release_port(self.local_port)
     
     def stop(self):
         """
         停止 Shadowsocks 进程
         """
-        if self.process:
-            try:
-                self.process.terminate()
-                self.process.wait(timeout=3)
-            except:
-                try:
-                    self.process.kill()
-                except:
-                    pass
-            finally:
-                self.process = None
+        self._terminate()
 
 
 class V2rayProtocol(ObfuscationProtocol):
@@ -407,40 +710,7 @@ class V2rayProtocol(ObfuscationProtocol):
         Returns:
             str: v2ray 可执行文件路径，如果未找到则返回 None
         """
-        # 预设路径
-        # 获取当前脚本所在目录
-        script_dir = Path(__file__).parent.absolute()
-        
-        paths = [
-            str(script_dir / "v2ray"),  # 项目目录中的可执行文件
-            str(script_dir / "v2ray.exe"),
-            "v2ray",  # 如果在 PATH 中
-            "v2ray.exe",
-            str(Path.home() / "v2ray"),
-            str(Path.home() / "v2ray.exe"),
-            str(Path.home() / ".local" / "bin" / "v2ray"),
-            "C:/Program Files/v2ray/v2ray.exe",
-            "C:/Program Files (x86)/v2ray/v2ray.exe"
-        ]
-        
-        # 检查每个路径
-        for path in paths:
-            try:
-                # 尝试运行 v2ray 版本命令
-                result = subprocess.run(
-                    [path, "version"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    timeout=2
-                )
-                if result.returncode == 0 or "v2ray" in result.stdout.lower():
-                    logger.info(f"Found v2ray at {path}")
-                    return path
-            except (subprocess.SubprocessError, FileNotFoundError):
-                continue
-        
-        return None
+        return ObfuscationFactory.find_executable("v2ray")
     
     def _create_config_file(self):
         """
@@ -449,89 +719,33 @@ class V2rayProtocol(ObfuscationProtocol):
         Returns:
             str: 配置文件路径
         """
-        # 创建临时配置文件
-        config_dir = Path.home() / ".config" / "sshdynamicproxy"
-        config_dir.mkdir(parents=True, exist_ok=True)
-        config_file = config_dir / f"v2ray_config_{random.randint(1000, 9999)}.json"
-        
-        # 基本配置
-        config = {
-            "log": {
-                "loglevel": "warning"
-            },
-            "inbounds": [
-                {
-                    "port": self.local_port,
-                    "listen": "127.0.0.1",
-                    "protocol": "socks",
-                    "settings": {
-                        "udp": True
-                    }
-                }
-            ],
-            "outbounds": [
-                {
-                    "protocol": "vmess",
-                    "settings": {
-                        "vnext": [
-                            {
-                                "address": self.server,
-                                "port": self.server_port,
-                                "users": [
-                                    {
-                                        "id": self.uuid,
-                                        "alterId": self.alter_id,
-                                        "security": self.security
-                                    }
-                                ]
-                            }
-                        ]
-                    },
-                    "streamSettings": {
-                        "network": self.network,
-                        "security": "tls" if self.tls else "none"
-                    }
-                }
-            ]
+        # 只有叶子值会变化：逐个编码为 JSON 后填入预先写好的模板
+        values = {
+            key: json.dumps(value) for key, value in (
+                ("local_port", self.local_port),
+                ("server", self.server),
+                ("server_port", self.server_port),
+                ("uuid", self.uuid),
+                ("alter_id", self.alter_id),
+                ("security", self.security),
+                ("network", self.network),
+                ("tls", "tls" if self.tls else "none"),
+                ("path", self.path),
+                ("ws_headers", {"Host": self.host} if self.host else {}),
+                ("path_list", self.path.split(",") if self.path else ["/"]),
+                ("host_list", self.host.split(",") if self.host else []),
+            )
         }
         
-        # 添加传输协议特定配置
-        if self.network == "ws":
-            config["outbounds"][0]["streamSettings"]["wsSettings"] = {
-                "path": self.path,
-                "headers": {"Host": self.host} if self.host else {}
-            }
-        elif self.network == "http":
-            config["outbounds"][0]["streamSettings"]["httpSettings"] = {
-                "path": self.path.split(",") if self.path else ["/"],
-                "host": self.host.split(",") if self.host else []
-            }
-        elif self.network == "tcp" and self.type == "http":
-            config["outbounds"][0]["streamSettings"]["tcpSettings"] = {
-                "header": {
-                    "type": "http",
-                    "request": {
-                        "version": "1.1",
-                        "method": "GET",
-                        "path": self.path.split(",") if self.path else ["/"],
-                        "headers": {
-                            "Host": self.host.split(",") if self.host else [],
-                            "User-Agent": [
-                                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36"
-                            ],
-                            "Accept-Encoding": ["gzip, deflate"],
-                            "Connection": ["keep-alive"],
-                            "Pragma": "no-cache"
-                        }
-                    }
-                }
-            }
-        
-        # 写入配置文件
-        with open(config_file, 'w') as f:
-            json.dump(config, f, indent=2)
-        
-        return str(config_file)
+        # 添加传输协议特定配置（tcp 只有 http 伪装时才需要）
+        transport_tpl = None
+        if self.network != "tcp" or self.type == "http":
+            transport_tpl = _V2RAY_TRANSPORT_TPLS.get(self.network)
+        values["transport"] = transport_tpl.substitute(values) if transport_tpl else ""
+        
+        # 配置包含 UUID 和每次新分配的本地端口，每次启动单独写入，停止时删除
+        data = _V2RAY_TPL.substitute(values).encode()
+        return _write_private_config_file("v2ray", ".json", data)
     
     def start(self):
         """
@@ -562,50 +776,36 @@ class V2rayProtocol(ObfuscationProtocol):
                 "-c", self.config_file
             ]
             
-            logger.info(f"Starting V2Ray: {' '.join(cmd)}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Starting V2Ray: %s", shlex.join(cmd))
             
             # 启动进程
-            self.process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
+            self.process = self._spawn(cmd)
             
             # 等待代理准备就绪
-            time.sleep(2)
-            if self.process.poll() is not None:
-                stdout, stderr = self.process.communicate()
-                logger.error(f"V2Ray failed to start: {stderr}")
+            if not self._wait_ready(socks=True):
+                self._log_start_failure("V2Ray")
                 return False
             
             return True
         except Exception as e:
-            logger.error(f"Error starting V2Ray: {str(e)}")
+            logger.error("Error starting V2Ray: %s", e)
             return False
+        finally:
+            # 子进程已绑定端口（或已失败），不再需要预留
+            self._release_port(self.local_port)
     
     def stop(self):
         """
         停止 V2Ray 进程
         """
-        if self.process:
-            try:
-                self.process.terminate()
-                self.process.wait(timeout=3)
-            except:
-                try:
-                    self.process.kill()
-                except:
-                    pass
-            finally:
-                self.process = None
-                
-        # 删除临时配置文件
-        if self.config_file and os.path.exists(self.config_file):
-            try:
+        self._terminate()
+        
+        # 删除包含凭据的配置文件
+        if self.config_file:
+            with contextlib.suppress(OSError):
                 os.remove(self.config_file)
-            except:
-                pass
+            self.config_file = None
 
 
 class StunnelProtocol(ObfuscationProtocol):
@@ -644,42 +844,7 @@ class StunnelProtocol(ObfuscationProtocol):
         Returns:
             str: stunnel 可执行文件路径，如果未找到则返回 None
         """
-        # 预设路径
-        # 获取当前脚本所在目录
-        script_dir = Path(__file__).parent.absolute()
-        
-        paths = [
-            str(script_dir / "stunnel"),  # 项目目录中的可执行文件
-            str(script_dir / "stunnel.exe"),
-            "stunnel",  # 如果在 PATH 中
-            "stunnel.exe",
-            str(Path.home() / "stunnel"),
-            str(Path.home() / "stunnel.exe"),
-            str(Path.home() / ".local" / "bin" / "stunnel"),
-            "/usr/bin/stunnel",
-            "/usr/local/bin/stunnel",
-            "C:/Program Files/stunnel/stunnel.exe",
-            "C:/Program Files (x86)/stunnel/stunnel.exe"
-        ]
-        
-        # 检查每个路径
-        for path in paths:
-            try:
-                # 尝试运行 stunnel 版本命令
-                result = subprocess.run(
-                    [path, "-version"],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    timeout=2
-                )
-                if result.returncode == 0 or "stunnel" in result.stdout.lower() or "stunnel" in result.stderr.lower():
-                    logger.info(f"Found stunnel at {path}")
-                    return path
-            except (subprocess.SubprocessError, FileNotFoundError):
-                continue
-        
-        return None
+        return ObfuscationFactory.find_executable("stunnel")
     
     def start(self):
         """启动 Stunnel 进行 TLS 加密
@@ -695,78 +860,183 @@ class StunnelProtocol(ObfuscationProtocol):
             logger.error("Cannot start stunnel: remote server not specified")
             return False
             
-        # 创建临时配置文件
-        import tempfile
-        self.config_file = tempfile.NamedTemporaryFile(mode='w', suffix='.conf', delete=False)
-        
-        # 生成配置内容
-        config_content = f"""
-; stunnel configuration for SSH Dynamic Proxy
-; Generated by SSHDynamicProxy
-client = yes
-debug = 5
-pid = 
-
-[ssh-proxy]
-accept = 127.0.0.1:{self.local_port}
-connect = {self.remote_server}
-verifyChain = {'yes' if self.verify else 'no'}
-{self.options}
-"""
-        
-        # 写入配置文件
-        self.config_file.write(config_content)
-        self.config_file.close()
+        # 生成配置文件（按内容命名，相同参数重启时复用）
+        config_content = _STUNNEL_TPL.substitute(
+            local_port=self.local_port,
+            remote=self.remote_server,
+            verify='yes' if self.verify else 'no',
+            options=self.options
+        )
+        self.config_file = _write_config_file("stunnel", ".conf", config_content.encode())
         
         # 启动 stunnel 进程
         try:
-            logger.info(f"Starting stunnel with config file: {self.config_file.name}")
-            self.process = subprocess.Popen(
-                [self.stunnel_path, self.config_file.name],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
+            logger.info("Starting stunnel with config file: %s", self.config_file)
+            self.process = self._spawn([self.stunnel_path, self.config_file])
             
-            # 检查进程是否成功启动
-            time.sleep(1)
-            if self.process.poll() is not None:
-                stderr = self.process.stderr.read()
-                logger.error(f"Failed to start stunnel: {stderr}")
+            # 检查进程是否成功启动（stunnel 只做 TLS 转发，不是 SOCKS 端口）
+            if not self._wait_ready():
+                self._log_start_failure("stunnel")
                 return False
                 
-            logger.info(f"Stunnel started successfully on port {self.local_port}")
+            logger.info("Stunnel started successfully on port %s", self.local_port)
             return True
             
         except Exception as e:
-            logger.error(f"Error starting stunnel: {str(e)}")
+            logger.error("Error starting stunnel: %s", e)
             return False
         
     def stop(self):
         """停止 Stunnel 进程"""
         if self.process:
-            try:
-                logger.info("Stopping stunnel process")
-                self.process.terminate()
-                self.process.wait(timeout=5)
-                self.process = None
-            except Exception as e:
-                logger.error(f"Error stopping stunnel: {str(e)}")
-                try:
-                    self.process.kill()
-                except:
-                    pass
-                self.process = None
-                
-        # 清理临时配置文件
-        if self.config_file and os.path.exists(self.config_file.name):
-            try:
-                os.unlink(self.config_file.name)
-                self.config_file = None
-            except Exception as e:
-                logger.error(f"Error removing stunnel config file: {str(e)}")
+            logger.info("Stopping stunnel process")
+            self._terminate()
+        
+        # 配置文件按内容命名，保留以便下次以相同参数启动时复用
 
 
+class PooledProtocol(ObfuscationProtocol):
+    """
+    多个 SOCKS 后端共用一个本地端口
+    在进程内转发客户端连接，后端按轮转顺序选择，连接失败时自动换下一个
+    """
+    
+    def __init__(self, protocols, local_port=None):
+        """
+        初始化共用端口
+        
+        Args:
+            protocols (list): 提供 SOCKS 端口的 ObfuscationProtocol 实例列表
+            local_port (int, optional): 监听端口，默认自动分配
+        """
+        super().__init__({})
+        self.protocols = list(protocols)
+        self.local_port = local_port
+        self._backends = []
+        self._next_backend = 0
+        self._lock = threading.Lock()
+        self._listener = None
+        self._accept_thread = None
+    
+    def start(self):
+        """
+        启动所有后端，然后在共用端口上开始监听
+        
+        Returns:
+            bool: 是否至少有一个后端成功启动
+        """
+        results = ObfuscationFactory.start_many(self.protocols)
+        self._backends = [
+            protocol.get_local_port()
+            for protocol, ok in zip(self.protocols, results) if ok
+        ]
+        if not self._backends:
+            logger.error("Cannot start pooled endpoint: no backend started")
+            return False
+        
+        try:
+            self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._listener.bind(('127.0.0.1', self.local_port or 0))
+            self._listener.listen(socket.SOMAXCONN)
+            self.local_port = self._listener.getsockname()[1]
+        except OSError as e:
+            logger.error("Error starting pooled endpoint: %s", e)
+            self.stop()
+            return False
+        
+        self._accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._accept_thread.start()
+        logger.info("Pooled endpoint on port %s -> backends %s", self.local_port, self._backends)
+        return True
+    
+    def stop(self):
+        """
+        关闭共用端口并停止所有后端
+        """
+        if self._listener:
+            # 仅 close 在 Linux 上不会唤醒阻塞在 accept 的线程
+            with contextlib.suppress(OSError):
+                self._listener.shutdown(socket.SHUT_RDWR)
+            self._listener.close()
+            self._listener = None
+        ObfuscationFactory.stop_many(self.protocols)
+        self._backends = []
+    
+    def _accept_loop(self):
+        """
+        接受客户端连接，每个连接在单独的线程中转发
+        """
+        listener = self._listener
+        while True:
+            try:
+                client, _ = listener.accept()
+            except OSError:
+                # 监听套接字已关闭
+                return
+            threading.Thread(target=self._handle_client, args=(client,), daemon=True).start()
+    
+    def _connect_backend(self):
+        """
+        连接下一个可用后端，失败时依次尝试其余后端
+        
+        Returns:
+            socket.socket: 已连接的套接字，如果所有后端都不可用则返回 None
+        """
+        with self._lock:
+            backends = self._backends
+            start = self._next_backend
+            self._next_backend = (start + 1) % max(len(backends), 1)
+        for i in range(len(backends)):
+            port = backends[(start + i) % len(backends)]
+            try:
+                return socket.create_connection(('127.0.0.1', port), timeout=2)
+            except OSError as e:
+                logger.warning("Backend on port %s unavailable: %s", port, e)
+        return None
+    
+    def _handle_client(self, client):
+        """
+        将客户端连接转发到一个后端
+        
+        Args:
+            client (socket.socket): 客户端连接
+        """
+        backend = self._connect_backend()
+        if backend is None:
+            client.close()
+            return
+        backend.settimeout(None)
+        reverse = threading.Thread(target=self._pipe, args=(backend, client), daemon=True)
+        reverse.start()
+        self._pipe(client, backend)
+        reverse.join()
+        client.close()
+        backend.close()
+    
+    @staticmethod
+    def _pipe(src, dst):
+        """
+        单向复制数据直到 src 关闭，然后关闭 dst 的写方向
+        
+        Args:
+            src (socket.socket): 读取端
+            dst (socket.socket): 写入端
+        """
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                dst.sendall(data)
+        except OSError:
+            # 连接异常，同时中断另一个方向
+            for sock in (src, dst):
+                with contextlib.suppress(OSError):
+                    sock.shutdown(socket.SHUT_RDWR)
+            return
+        with contextlib.suppress(OSError):
+            dst.shutdown(socket.SHUT_WR)
 
 class ObfuscationFactory:
     """
@@ -774,6 +1044,52 @@ class ObfuscationFactory:
     用于创建不同类型的混淆协议实例
     """
     
+    # 可执行文件名 -> 候选路径
+    EXECUTABLES = {
+        "obfs4proxy": _OBFS4_PATHS,
+        "ss-local": _SS_LOCAL_PATHS,
+        "v2ray": _V2RAY_PATHS,
+        "stunnel": _STUNNEL_PATHS,
+    }
+    # 查找结果的有效期（秒）
+    DISCOVERY_TTL = 300
+    
+    _discovered = {}
+    _discovered_at = None
+    _discovery_lock = threading.Lock()
+    discovery_hits = 0
+    discovery_misses = 0
+    
+    @classmethod
+    def _discover_all(cls):
+        """
+        查找所有混淆程序的可执行文件，结果保存在类级缓存中
+        """
+        cls._discovered = {
+            name: _find_executable(name, paths) for name, paths in cls.EXECUTABLES.items()
+        }
+        cls._discovered_at = time.monotonic()
+    
+    @classmethod
+    def find_executable(cls, name):
+        """
+        获取混淆程序可执行文件路径，首次调用或缓存过期时一次性查找全部程序
+        
+        Args:
+            name (str): 可执行文件名，EXECUTABLES 中的键
+            
+        Returns:
+            str: 可执行文件路径，如果未找到则返回 None
+        """
+        with cls._discovery_lock:
+            if (cls._discovered_at is not None
+                    and time.monotonic() - cls._discovered_at < cls.DISCOVERY_TTL):
+                cls.discovery_hits += 1
+            else:
+                cls.discovery_misses += 1
+                cls._discover_all()
+            return cls._discovered.get(name)
+    
     @staticmethod
     def create_protocol(protocol_type, config):
         """
@@ -795,5 +1111,65 @@ class ObfuscationFactory:
         elif protocol_type.lower() == 'stunnel':
             return StunnelProtocol(config)
         else:
-            logger.error(f"Unsupported obfuscation protocol: {protocol_type}")
-            return None
\ No newline at end of file
+            logger.error("Unsupported obfuscation protocol: %s", protocol_type)
+            return None
+    
+    @staticmethod
+    def create_pooled(specs, local_port=None):
+        """
+        创建多个后端共用一个本地 SOCKS 端口的实例
+        
+        Args:
+            specs (list): (protocol_type, config) 元组列表
+            local_port (int, optional): 共用的本地端口，默认自动分配
+            
+        Returns:
+            PooledProtocol: 共用端口实例，如果没有可用的后端则返回 None
+        """
+        protocols = []
+        for protocol_type, config in specs:
+            if protocol_type.lower() == 'stunnel':
+                # stunnel 只做 TLS 转发，不提供 SOCKS 端口
+                logger.error("stunnel cannot be pooled: it does not provide a SOCKS port")
+                continue
+            protocol = ObfuscationFactory.create_protocol(protocol_type, config)
+            if protocol:
+                protocols.append(protocol)
+        if not protocols:
+            return None
+        return PooledProtocol(protocols, local_port)
+    
+    @staticmethod
+    def start_many(protocols):
+        """
+        并发启动多个混淆协议实例
+        
+        Args:
+            protocols (list): ObfuscationProtocol 实例列表
+            
+        Returns:
+            list: 与 protocols 对应的启动结果 (bool)
+        """
+        if not protocols:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(protocols)) as executor:
+            return list(executor.map(lambda protocol: protocol.start(), protocols))
+    
+    @staticmethod
+    def stop_many(protocols):
+        """
+        并发停止多个混淆协议实例，各进程的退出等待时间相互重叠
+        
+        Args:
+            protocols (list): ObfuscationProtocol 实例列表
+        """
+        if not protocols:
+            return
+        if psutil is not None:
+            # 一次 wait_procs 就能同时等待所有进程，之后 stop() 只剩清理工作
+            ObfuscationProtocol._terminate_all(protocols)
+            for protocol in protocols:
+                protocol.stop()
+            return
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(protocols)) as executor:
+            list(executor.map(lambda protocol: protocol.stop(), protocols))
@@ -7,36 +7,697 @@ Handles SSH connections and dynamic proxy setup
 """
 
 import os
+import re
 import sys
 import subprocess
 import platform
 import shlex
 import logging
 import socket
+import signal
 import time
+import selectors
 import threading
+import hashlib
+import functools
+import itertools
+import collections
+import tempfile
+import concurrent.futures
 from pathlib import Path
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
+logger = logging.getLogger("ssh_proxy")
+
+# Seconds to wait for a new master connection to authenticate
+MASTER_START_TIMEOUT = 30
+
+# Keepalive probes: a dead connection is dropped after interval * count seconds
+SERVER_ALIVE_INTERVAL = 10
+SERVER_ALIVE_COUNT_MAX = 2
+# Seconds to wait for the TCP connection to the SSH server
+SSH_CONNECT_TIMEOUT = 5
+
+# Local ports tried before giving up when obfs4proxy finds its port taken
+OBFS_PORT_ATTEMPTS = 5
+# stderr fragments meaning the port was already bound (POSIX, Windows)
+ADDRESS_IN_USE_MARKERS = ("address already in use", "only one usage of each socket address")
+
+# Seconds an SSH process group gets to exit on disconnect before it is killed (Unix)
+SSH_TERMINATE_GRACE = 0.5
+
+# Lines of SSH stderr kept per process for error reports
+STDERR_TAIL_LINES = 256
+
+# Suffixes that keep ControlPath sockets of masters for the same server apart
+_control_ids = itertools.count()
+# Name prefix of master ControlPath sockets: <prefix><key hash>-<app pid>-<n>
+CONTROL_SOCKET_PREFIX = "sshdp-cm-"
+
+# Environment variable the SSH_ASKPASS helper reads the password from
+ASKPASS_ENV_VAR = "SSHDP_ASKPASS_PASSWORD"
+
+# Event loop thread that drives asyncssh connections, started on first use
+_async_loop = None
+_async_loop_lock = threading.Lock()
+
+# Thread that reads the stderr of every SSH process (POSIX), started on first use
+_stderr_pump = None
+_stderr_pump_lock = threading.Lock()
+
+
+# First PuTTY release whose plink accepts -pwfile
+PLINK_PWFILE_VERSION = (0, 77)
+
+# Windows SSH clients, in order of preference
+WINDOWS_SSH_CANDIDATES = (
+    "C:/Windows/System32/OpenSSH/ssh.exe",  # OpenSSH in Windows 10/11
+    "C:/Program Files/Git/usr/bin/ssh.exe",  # Git's SSH
+    "C:/Program Files/PuTTY/plink.exe",  # PuTTY's plink
 )
 
-logger = logging.getLogger("ssh_proxy")
+
+@functools.lru_cache(maxsize=1)
+def _detect_ssh_command(platform_name):
+    """
+    Find the SSH executable for a platform (probed once per process)
+    
+    Args:
+        platform_name (str): Result of platform.system()
+        
+    Returns:
+        str: Path to the SSH executable, or 'ssh' to use PATH
+    """
+    # Linux/macOS use the system SSH
+    if platform_name != "Windows":
+        return "ssh"
+    # Otherwise the first installed client; if none, assume 'ssh' is in PATH
+    return next((candidate for candidate in WINDOWS_SSH_CANDIDATES if os.path.isfile(candidate)), "ssh")
+
+
+@functools.lru_cache(maxsize=1)
+def _askpass_helper():
+    """
+    Write the SSH_ASKPASS helper, which prints the password from ASKPASS_ENV_VAR
+    
+    Returns:
+        str: Path to the helper script
+    """
+    from config import default_config_dir
+    helper_dir = default_config_dir()
+    helper_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if os.name == "nt":
+        helper = helper_dir / "askpass.cmd"
+        script = (f'@"{sys.executable}" -c "import os, sys; '
+                  f'sys.stdout.write(os.environ[\'{ASKPASS_ENV_VAR}\'] + chr(10))"\r\n')
+    else:
+        helper = helper_dir / "askpass"
+        script = f'#!/bin/sh\nprintf \'%s\\n\' "${ASKPASS_ENV_VAR}"\n'
+    # 脚本本身不含密码，密码只通过子进程环境传递
+    helper.write_text(script)
+    helper.chmod(0o700)
+    return str(helper)
+
+
+def _password_env(password):
+    """
+    Build the environment that makes OpenSSH read the password from the askpass helper
+    
+    Args:
+        password (str): SSH password
+        
+    Returns:
+        dict: Copy of os.environ with the SSH_ASKPASS settings added
+    """
+    env = os.environ.copy()
+    env[ASKPASS_ENV_VAR] = password
+    env["SSH_ASKPASS"] = _askpass_helper()
+    # OpenSSH 8.4+ 即使有终端也使用 askpass；旧版本需要 DISPLAY 且没有终端
+    env["SSH_ASKPASS_REQUIRE"] = "force"
+    env.setdefault("DISPLAY", ":0")
+    return env
+
+
+def _import_asyncssh():
+    """
+    Import asyncssh on first use, so that clients that never ask for it
+    do not pay for loading it and asyncio
+    
+    Returns:
+        module: The asyncssh module
+    """
+    try:
+        import asyncssh
+    except ImportError:  # 可选依赖：未安装时使用外部 ssh 客户端
+        raise Exception("asyncssh is not installed")
+    return asyncssh
+
+
+def _get_async_loop():
+    """
+    Get the background event loop for asyncssh connections, starting it once
+    
+    Returns:
+        asyncio.AbstractEventLoop: Loop running forever in a daemon thread
+    """
+    global _async_loop
+    with _async_loop_lock:
+        if _async_loop is None:
+            import asyncio
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="asyncssh-loop", daemon=True).start()
+            _async_loop = loop
+        return _async_loop
+
+
+def _write_password_file(password):
+    """
+    Write a password to a private temp file for plink -pwfile
+    
+    Args:
+        password (str): SSH password
+        
+    Returns:
+        str: Path to the file; the caller removes it once plink has read it
+    """
+    fd, path = tempfile.mkstemp(prefix="sshdp-", suffix=".pw")
+    with os.fdopen(fd, "w") as f:
+        f.write(password)
+    return path
+
+
+@functools.lru_cache(maxsize=None)
+def _plink_supports_pwfile(plink_command):
+    """
+    Check whether plink is new enough for -pwfile (checked once per executable)
+    
+    Args:
+        plink_command (str): Path to plink
+        
+    Returns:
+        bool: True if `plink -V` reports PuTTY 0.77 or later
+    """
+    try:
+        result = subprocess.run(
+            [plink_command, "-V"],
+            stdin=subprocess.DEVNULL,
+            capture_output=True,
+            text=True,
+            timeout=SSH_CONNECT_TIMEOUT,
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        logger.warning("Could not check the plink version: %s", e)
+        return False
+    # 例如 "plink: Release 0.78"
+    match = re.search(r"Release (\d+)\.(\d+)", result.stdout + result.stderr)
+    return bool(match) and tuple(map(int, match.groups())) >= PLINK_PWFILE_VERSION
+
+
+def _remove_password_file_later(path, process, local_port):
+    """
+    Remove plink's password file once its SOCKS port listens or it exits
+    
+    Runs in a daemon thread; gives up waiting after MASTER_START_TIMEOUT.
+    
+    Args:
+        path (str): File written by _write_password_file()
+        process (subprocess.Popen): The plink process reading it
+        local_port (int): Local port of its SOCKS forward
+    """
+    deadline = time.monotonic() + MASTER_START_TIMEOUT
+    while process.poll() is None and time.monotonic() < deadline:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.settimeout(0.2)
+            if s.connect_ex(('127.0.0.1', local_port)) == 0:
+                break
+        time.sleep(0.2)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _record_stderr_line(process, raw, on_output=None):
+    """
+    Keep one line of SSH stderr in process.stderr_tail and pass it on
+    
+    Args:
+        process (subprocess.Popen): The SSH process
+        raw (bytes): Line read from its stderr
+        on_output (callable, optional): Called with the line if it is not empty
+    """
+    line = raw.decode('utf-8', errors='replace').rstrip()
+    if not line:
+        return
+    process.stderr_tail.append(line)
+    logger.debug("[ssh %s] %s", process.pid, line)
+    if on_output:
+        on_output(line)
+
+
+class _StderrPump:
+    """
+    Reads the stderr pipes of all SSH processes from one selector thread,
+    instead of one reader thread per process
+    
+    Pipes are switched to non-blocking mode. Sets process.stderr_closed when
+    a pipe reaches EOF.
+    """
+    
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._pending = collections.deque()
+        # 新加入的管道通过唤醒管道交给泵线程注册，选择器只在该线程中使用
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        threading.Thread(target=self._run, name="ssh-stderr", daemon=True).start()
+    
+    def add(self, process, on_output=None):
+        """
+        Start reading a process's stderr
+        
+        Args:
+            process (subprocess.Popen): SSH process started with stderr=PIPE
+            on_output (callable, optional): Called with each non-empty line
+        """
+        os.set_blocking(process.stderr.fileno(), False)
+        self._pending.append((process, on_output))
+        os.write(self._wake_w, b"\0")
+    
+    def _run(self):
+        while True:
+            for key, _ in self._selector.select():
+                if key.data is None:
+                    self._register_pending()
+                else:
+                    self._read(key)
+    
+    def _register_pending(self):
+        try:
+            os.read(self._wake_r, 4096)
+        except BlockingIOError:
+            pass
+        while self._pending:
+            process, on_output = self._pending.popleft()
+            self._selector.register(process.stderr.fileno(), selectors.EVENT_READ,
+                                    (process, on_output, bytearray()))
+    
+    def _read(self, key):
+        process, on_output, buffer = key.data
+        try:
+            chunk = os.read(key.fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b""
+        if chunk:
+            buffer += chunk
+            *lines, rest = buffer.split(b"\n")
+            buffer[:] = rest
+            for raw in lines:
+                _record_stderr_line(process, raw, on_output)
+            return
+        # EOF：输出剩余的不完整行
+        self._selector.unregister(key.fd)
+        _record_stderr_line(process, bytes(buffer), on_output)
+        process.stderr_closed.set()
+
+
+def _get_stderr_pump():
+    """
+    Get the shared stderr reader, starting it once
+    
+    Returns:
+        _StderrPump: The reader thread's pump
+    """
+    global _stderr_pump
+    with _stderr_pump_lock:
+        if _stderr_pump is None:
+            _stderr_pump = _StderrPump()
+        return _stderr_pump
+
+
+class SSHSession:
+    """
+    A background OpenSSH master connection (ssh -M -N -f) that carries
+    SOCKS forwards added with ssh -O forward
+    """
+    
+    def __init__(self, ssh_command, key, control_path, pid):
+        """
+        Args:
+            ssh_command (str): SSH executable
+            key (tuple): (username, host, port, key_path) of the connection
+            control_path (str): ControlPath socket of the master
+            pid (int): pid of the master ssh process
+        """
+        self.ssh_command = ssh_command
+        self.key = key
+        self.control_path = control_path
+        self.pid = pid
+        self.open_channels = 0
+    
+    def alive(self):
+        """Check that the master process and its control socket still exist"""
+        if not os.path.exists(self.control_path):
+            return False
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+    
+    def command(self, operation, *args):
+        """
+        Send a control command (-O) to the master connection
+        
+        Args:
+            operation (str): check, forward, cancel or exit
+            *args (str): Extra options, e.g. the forward to add or cancel
+            
+        Returns:
+            subprocess.CompletedProcess: Result, or None if ssh could not be run
+        """
+        return _mux_command(self.ssh_command, self.control_path, self.key, operation, *args)
+
+
+def _mux_command(ssh_command, control_path, key, operation, *args):
+    """
+    Send a control command (-O) to the master listening on control_path
+    
+    Args:
+        ssh_command (str): SSH executable
+        control_path (str): ControlPath socket of the master
+        key (tuple): (username, host, port, key_path) of the connection
+        operation (str): check, forward, cancel or exit
+        *args (str): Extra options, e.g. the forward to add or cancel
+        
+    Returns:
+        subprocess.CompletedProcess: Result, or None if ssh could not be run
+    """
+    username, host, port, _ = key
+    try:
+        return subprocess.run(
+            [
+                ssh_command,
+                "-o", f"ControlPath={control_path}",
+                "-O", operation,
+                *args,
+                "-p", str(port),
+                f"{username}@{host}"
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=5
+        )
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning("ssh -O %s failed: %s", operation, e)
+        return None
+
+
+class SSHConnectionPool:
+    """
+    Pool of master connections keyed by (username, host, port, key_path)
+    
+    Tunnels to the same server share a master until it carries MAX_CHANNELS
+    forwards; a master is closed as soon as its last forward is released.
+    """
+    
+    # Forwards per master; sshd allows MaxSessions=10 by default
+    MAX_CHANNELS = 8
+    
+    def __init__(self):
+        self._sessions = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def reap_orphaned_masters(ssh_command):
+        """
+        Close masters left behind by an earlier run that exited without cleanup
+        
+        Masters persist until told to exit, so ones whose owning app process
+        (the pid in the socket name) is gone are closed here.
+        
+        Args:
+            ssh_command (str): SSH executable
+        """
+        control_dir = Path.home() / ".ssh"
+        for socket_path in control_dir.glob(f"{CONTROL_SOCKET_PREFIX}*"):
+            try:
+                owner = int(socket_path.name.rsplit("-", 2)[1])
+            except (IndexError, ValueError):
+                continue
+            if owner == os.getpid():
+                continue
+            try:
+                os.kill(owner, 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+                
+            logger.info("Closing orphaned SSH master connection %s", socket_path)
+            try:
+                subprocess.run(
+                    [ssh_command, "-o", f"ControlPath={socket_path}", "-O", "exit", "orphan"],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    timeout=5
+                )
+            except (subprocess.SubprocessError, OSError):
+                pass
+            # 主连接已不存在时只剩下失效的套接字文件
+            try:
+                socket_path.unlink()
+            except OSError:
+                pass
+    
+    def acquire(self, key):
+        """
+        Take a channel on a live master for key
+        
+        Args:
+            key (tuple): (username, host, port, key_path)
+            
+        Returns:
+            SSHSession: Session with a free channel, or None if a new master is needed
+        """
+        with self._lock:
+            sessions = self._sessions[key]
+            for session in list(sessions):
+                if not session.alive():
+                    sessions.remove(session)
+                elif session.open_channels < self.MAX_CHANNELS:
+                    session.open_channels += 1
+                    return session
+        return None
+    
+    def add(self, session):
+        """
+        Add a newly started master, with one channel taken by the caller
+        
+        Args:
+            session (SSHSession): The new master connection
+        """
+        session.open_channels = 1
+        with self._lock:
+            self._sessions[session.key].append(session)
+    
+    def reserve(self, session):
+        """
+        Take another channel on a specific master
+        
+        Args:
+            session (SSHSession): The master connection
+            
+        Returns:
+            bool: True if the master is alive and had a free channel
+        """
+        with self._lock:
+            # 已释放完所有通道的主连接正在关闭，不再使用
+            if session not in self._sessions[session.key]:
+                return False
+            if session.open_channels < self.MAX_CHANNELS and session.alive():
+                session.open_channels += 1
+                return True
+        return False
+    
+    def release(self, session):
+        """
+        Give back a channel taken with acquire(), add() or reserve(), closing
+        the master when it was the last one
+        
+        Args:
+            session (SSHSession): The master connection
+        """
+        with self._lock:
+            session.open_channels = max(session.open_channels - 1, 0)
+            if session.open_channels > 0:
+                return
+            sessions = self._sessions[session.key]
+            if session not in sessions:
+                return
+            sessions.remove(session)
+        if session.alive():
+            logger.info("Closing unused SSH master connection (pid %s)", session.pid)
+            session.command("exit")
+    
+    def close_all(self):
+        """Close every master connection"""
+        with self._lock:
+            sessions = [session for queued in self._sessions.values() for session in queued]
+            self._sessions.clear()
+        for session in sessions:
+            if session.alive():
+                session.command("exit")
+
+
+class MuxTunnel:
+    """
+    A SOCKS forward registered on a shared OpenSSH master connection
+    
+    Returned by SSHProxy.connect() instead of a subprocess.Popen when the
+    tunnel is multiplexed, and implements the part of the Popen interface
+    callers use (pid, poll, wait, terminate, kill).
+    """
+    
+    stdin = stdout = stderr = None
+    
+    def __init__(self, pool, session, local_port):
+        """
+        Args:
+            pool (SSHConnectionPool): Pool the session was taken from
+            session (SSHSession): Master connection carrying the forward
+            local_port (int): Local port of the SOCKS forward
+        """
+        self._pool = pool
+        self.session = session
+        self.local_port = local_port
+        self.pid = session.pid
+        self.args = [session.ssh_command, "-O", "forward", "-D", f"127.0.0.1:{local_port}"]
+        self.returncode = None
+    
+    def poll(self):
+        """Return None while the forward is active, otherwise its return code"""
+        if self.returncode is None and not self.session.alive():
+            logger.warning("Master connection for port %s has exited", self.local_port)
+            self._pool.release(self.session)
+            self.returncode = 255
+        return self.returncode
+    
+    def wait(self, timeout=None):
+        """Wait until the forward is closed or its master exits"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.poll() is None:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            time.sleep(0.1)
+        return self.returncode
+    
+    def terminate(self):
+        """Cancel the forward and return its channel to the pool"""
+        if self.returncode is None:
+            self.session.command("cancel", "-D", f"127.0.0.1:{self.local_port}")
+            self._pool.release(self.session)
+            self.returncode = 0
+    
+    kill = terminate
+
+
+class AsyncSSHTunnel:
+    """
+    A SOCKS forward on an asyncssh connection driven by the background event loop
+    
+    Returned by SSHProxy.connect() instead of a subprocess.Popen when asyncssh
+    is requested, and implements the same part of the Popen interface as
+    MuxTunnel. There is no child process, so pid is None.
+    """
+    
+    stdin = stdout = stderr = None
+    
+    def __init__(self, proxy, loop, key, conn, listener, local_port):
+        """
+        Args:
+            proxy (SSHProxy): Proxy whose shared connections the tunnel uses
+            loop (asyncio.AbstractEventLoop): Loop the connection runs on
+            key (tuple): (username, host, port, key_path) of the connection
+            conn (asyncssh.SSHClientConnection): Connection carrying the forward
+            listener (asyncssh.SSHListener): SOCKS listener of the forward
+            local_port (int): Local port of the SOCKS forward
+        """
+        self._proxy = proxy
+        self._loop = loop
+        self._key = key
+        self.conn = conn
+        self.listener = listener
+        self.local_port = local_port
+        self.pid = None
+        self.args = ["asyncssh", "-D", f"127.0.0.1:{local_port}"]
+        self.returncode = None
+        import asyncio
+        self._closed = asyncio.run_coroutine_threadsafe(conn.wait_closed(), loop)
+    
+    def poll(self):
+        """Return None while the forward is active, otherwise its return code"""
+        if self.returncode is None and self._closed.done():
+            logger.warning(f"SSH connection for port {self.local_port} has closed")
+            self.returncode = 255
+        return self.returncode
+    
+    def wait(self, timeout=None):
+        """Wait until the forward is closed or its connection drops"""
+        if self.returncode is None:
+            try:
+                self._closed.result(timeout)
+            except concurrent.futures.TimeoutError:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            except Exception:
+                pass
+        return self.poll()
+    
+    def terminate(self):
+        """Close the SOCKS listener, and the connection once no forward uses it"""
+        if self.returncode is None:
+            import asyncio
+            future = asyncio.run_coroutine_threadsafe(
+                self._proxy._arelease(self._key, self.conn, self.listener), self._loop)
+            try:
+                future.result(timeout=5)
+            except Exception as e:
+                logger.warning(f"Closing SSH forward on port {self.local_port} failed: {str(e)}")
+            self.returncode = 0
+    
+    kill = terminate
+
 
 class SSHProxy:
     """
     Class to handle SSH connections and dynamic proxy setup
     """
     
-    def __init__(self):
-        """Initialize the SSH proxy handler"""
+    def __init__(self, pool=None):
+        """
+        Initialize the SSH proxy handler
+        
+        Args:
+            pool (SSHConnectionPool, optional): Master connection pool to share
+                between proxies; a new one is created if not given
+        """
         self.platform = platform.system()
         self.ssh_command = self._get_ssh_command()
+        if pool is None:
+            pool = SSHConnectionPool()
+            if self._supports_multiplexing():
+                pool.reap_orphaned_masters(self.ssh_command)
+        self.pool = pool
+        # asyncssh connections shared by tunnels: key -> [connection, forward count];
+        # only touched from the event loop thread
+        self._async_conns = {}
         logger.info(f"Platform detected: {self.platform}")
         logger.info(f"SSH command: {self.ssh_command}")
     
@@ -45,30 +706,10 @@ class SSHProxy:
         Get the appropriate SSH command based on the platform
         Returns the path to the SSH executable
         """
-        if self.platform == "Windows":
-            # Check for OpenSSH in Windows 10/11
-            openssh_path = Path("C:/Windows/System32/OpenSSH/ssh.exe")
-            if openssh_path.exists():
-                return str(openssh_path)
-                
-            # Check for Git's SSH
-            git_ssh_path = Path("C:/Program Files/Git/usr/bin/ssh.exe")
-            if git_ssh_path.exists():
-                return str(git_ssh_path)
-                
-            # Check for PuTTY's plink
-            plink_path = Path("C:/Program Files/PuTTY/plink.exe")
-            if plink_path.exists():
-                return str(plink_path)
-                
-            # Default to 'ssh', assuming it's in PATH
-            return "ssh"
-        else:
-            # For Linux/macOS, use the system SSH
-            return "ssh"
+        return _detect_ssh_command(self.platform)
     
     def connect(self, host, port, username, local_port, password=None, key_path=None, 
-               obfs_protocol=None, obfs_config=None):
+               obfs_protocol=None, obfs_config=None, on_output=None, use_asyncssh=False):
         """
         Establish an SSH connection with dynamic port forwarding
         支持多种流量混淆技术和SSL/TLS隧道
@@ -82,6 +723,10 @@ class SSHProxy:
             key_path (str, optional): Path to SSH private key
             obfs_protocol (str): 混淆协议类型，如 'obfs4', 'shadowsocks', 'v2ray'，None表示不启用混淆
             obfs_config (dict): 混淆协议配置
+            on_output (callable, optional): Called from the stderr reader thread with each
+                line the SSH process writes to stderr
+            use_asyncssh (bool): Connect with the built-in asyncssh client instead of
+                the ssh executable (no obfuscation; ignores ~/.ssh/config)
             
         Returns:
             tuple: (SSH process, Obfuscation protocol) 如果启用混淆
@@ -90,6 +735,7 @@ class SSHProxy:
         """
         obfs_protocol_instance = None
         obfs_port = None
+        password_file = None
         
         try:
             # 如果需要流量混淆，先启动混淆代理
@@ -113,9 +759,14 @@ class SSHProxy:
                 # 已在前面的代码中处理了错误情况
                 logger.info(f"Obfuscation proxy running on port {obfs_port}")
             
-            # Build the SSH command
-            cmd = []
+            # Without obfuscation, tunnels to the same server share one SSH
+            # connection: in-process with asyncssh if requested, else an OpenSSH master
+            if not obfs_protocol_instance and use_asyncssh:
+                return self._connect_async(host, port, username, local_port, key_path, password)
+            if not obfs_protocol_instance and self._supports_multiplexing():
+                return self._connect_mux(host, port, username, local_port, key_path, password)
             
+            # Build the SSH command
             # 如果使用stunnel协议，修改连接参数
             if obfs_protocol == 'stunnel':
                 # 通过本地stunnel端口连接
@@ -137,13 +788,22 @@ class SSHProxy:
             else:
                 # 标准SSH命令
                 if self.platform == "Windows" and "plink" in self.ssh_command and password:
+                    if _plink_supports_pwfile(self.ssh_command):
+                        # plink 在解析参数时读取 -pwfile，密码不出现在命令行中
+                        password_file = _write_password_file(password)
+                        password_args = ["-pwfile", password_file]
+                    else:
+                        logger.warning("plink is older than PuTTY 0.77 and has no -pwfile; "
+                                       "passing the password with -pw, where other local "
+                                       "users can see it in the process list")
+                        password_args = ["-pw", password]
                     base_cmd = [
                         self.ssh_command,
                         "-ssh",
                         "-D", f"127.0.0.1:{local_port}",
                         "-P", str(port),
                         "-l", username,
-                        "-pw", password,
+                        *password_args,
                         host,
                         "-N"  # No command execution
                     ]
@@ -156,54 +816,96 @@ class SSHProxy:
                         "-N"  # No command execution
                     ]
             
-            # 添加额外选项
-            cmd = base_cmd.copy()
-                
+            # 添加更好的连接选项
+            if "plink" in self.ssh_command:
+                # plink 不支持 OpenSSH 的 -q 和 -o 选项
+                opts = ["-C"]  # 压缩
+            else:
+                opts = [
+                    "-q",  # 安静模式
+                    "-C",  # 压缩
+                    "-o", f"ServerAliveInterval={SERVER_ALIVE_INTERVAL}",
+                    "-o", f"ServerAliveCountMax={SERVER_ALIVE_COUNT_MAX}",
+                    "-o", f"ConnectTimeout={SSH_CONNECT_TIMEOUT}",
+                    "-o", "ExitOnForwardFailure=yes",  # 本地端口绑定失败时立即退出
+                    "-o", "TCPKeepAlive=yes"
+                ]
+                if not password:
+                    # 没有密码可提供时不要等待交互式提示，直接失败
+                    opts += ["-o", "BatchMode=yes"]
+            
             # 添加密钥文件（如果指定）
             if key_path:
-                cmd.insert(1, "-i")
-                cmd.insert(2, key_path)
+                opts += ["-i", key_path]
             
-            # 添加更好的连接选项
-            cmd.insert(1, "-o")
-            cmd.insert(2, "ServerAliveInterval=60")
-            cmd.insert(3, "-o")
-            cmd.insert(4, "ServerAliveCountMax=3")
-            cmd.insert(1, "-C")  # 压缩
-            cmd.insert(1, "-q")  # 安静模式
-            
-            # 日志记录命令（不包括密码）
-            log_cmd = cmd.copy()
-            if password and "-pw" in log_cmd:
-                pw_index = log_cmd.index("-pw")
-                log_cmd[pw_index + 1] = "********"
-            logger.info(f"Executing SSH command: {' '.join(log_cmd)}")
+            cmd = [self.ssh_command] + opts + base_cmd[1:]
+            # OpenSSH 没有密码参数，通过 SSH_ASKPASS 从环境变量读取
+            env = _password_env(password) if password and not password_file else None
+            if logger.isEnabledFor(logging.INFO):
+                # 不把 -pw 的密码写进日志
+                logged = ["***" if password and arg == password else arg for arg in cmd]
+                logger.info("Executing SSH command: %s", shlex.join(logged))
             
             # 启动SSH进程
+            # ssh -N 不向 stdout 输出；stderr 由读取线程持续读取，避免管道写满阻塞 ssh
             if self.platform == "Windows":
                 # Windows系统
+                # 不弹出控制台窗口，且不继承父进程句柄
                 process = subprocess.Popen(
                     cmd,
-                    stdout=subprocess.PIPE,
+                    stdout=subprocess.DEVNULL,
                     stderr=subprocess.PIPE,
-                    creationflags=subprocess.CREATE_NEW_PROCESS_GROUP
+                    env=env,
+                    close_fds=True,
+                    creationflags=subprocess.CREATE_NO_WINDOW
                 )
             else:
                 # Unix-like系统
+                # 独立会话，断开时可以向整个进程组发送信号
+                # 不要改用 preexec_fn=os.setsid：那样 subprocess 无法使用 vfork，
+                # 每次连接都要复制整个进程的页表
                 process = subprocess.Popen(
                     cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                    env=env,
+                    start_new_session=True
                 )
             
+            # 最近的 stderr 输出，随进程对象保存
+            process.stderr_tail = collections.deque(maxlen=STDERR_TAIL_LINES)
+            process.stderr_closed = threading.Event()
+            if self.platform == "Windows":
+                # Windows 的管道不能用 select，仍然每个进程一个读取线程
+                threading.Thread(
+                    target=self._drain_stderr,
+                    args=(process, on_output),
+                    daemon=True
+                ).start()
+            else:
+                _get_stderr_pump().add(process, on_output)
+            
             # 检查进程是否启动成功
-            if process.poll() is not None:
-                # 进程立即终止
-                stdout, stderr = process.communicate()
-                error_msg = stderr.decode('utf-8', errors='replace')
+            try:
+                process.wait(timeout=0.5)
+            except subprocess.TimeoutExpired:
+                pass
+            else:
+                # 进程立即终止，等读取线程取完剩余输出
+                process.stderr_closed.wait(timeout=1)
+                error_msg = "\n".join(process.stderr_tail)
                 logger.error(f"SSH process failed to start: {error_msg}")
                 raise Exception(f"SSH connection failed: {error_msg}")
             
+            if password_file:
+                # plink 可能仍在启动，端口开始监听或进程退出后再删除密码文件
+                threading.Thread(
+                    target=_remove_password_file_later,
+                    args=(password_file, process, local_port),
+                    daemon=True
+                ).start()
+                password_file = None
+            
             logger.info(f"SSH connection established to {host}:{port}")
             # 返回结果：如果启用了混淆，返回元组；否则只返回SSH进程
             if obfs_protocol_instance:
@@ -217,6 +919,306 @@ class SSHProxy:
             if obfs_protocol_instance:
                 obfs_protocol_instance.stop()
             raise
+        finally:
+            if password_file:
+                try:
+                    os.remove(password_file)
+                except OSError:
+                    pass
+    
+    def _drain_stderr(self, process, on_output=None):
+        """
+        Read an SSH process's stderr until EOF into process.stderr_tail
+        (Windows; on POSIX the shared _StderrPump reads it)
+        
+        Args:
+            process (subprocess.Popen): The SSH process
+            on_output (callable, optional): Called with each non-empty line
+        """
+        for raw in iter(process.stderr.readline, b''):
+            _record_stderr_line(process, raw, on_output)
+        process.stderr_closed.set()
+    
+    def _supports_multiplexing(self):
+        """
+        Check whether the SSH client supports OpenSSH connection multiplexing
+        
+        Returns:
+            bool: True for OpenSSH on Linux/macOS; False on Windows and for plink
+        """
+        return self.platform != "Windows" and "plink" not in self.ssh_command
+    
+    def _get_control_path(self, key):
+        """
+        Get a new ControlPath socket for a master connection
+        
+        Args:
+            key (tuple): (username, host, port, key_path)
+            
+        Returns:
+            str: ControlPath for the ssh -o option
+        """
+        control_dir = Path.home() / ".ssh"
+        control_dir.mkdir(mode=0o700, exist_ok=True)
+        # Hashed so the socket path stays below the sun_path length limit;
+        # a key can have several masters, so each gets its own suffix
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        return str(control_dir / f"{CONTROL_SOCKET_PREFIX}{digest}-{os.getpid()}-{next(_control_ids)}")
+    
+    def _start_master(self, key, password=None):
+        """
+        Start a background master connection (ssh -M -N -f)
+        
+        Args:
+            key (tuple): (username, host, port, key_path)
+            password (str, optional): SSH password, passed through SSH_ASKPASS
+            
+        Returns:
+            SSHSession: The running master connection
+        """
+        username, host, port, key_path = key
+        control_path = self._get_control_path(key)
+        cmd = [
+            self.ssh_command,
+            "-C",
+            "-o", f"ServerAliveInterval={SERVER_ALIVE_INTERVAL}",
+            "-o", f"ServerAliveCountMax={SERVER_ALIVE_COUNT_MAX}",
+            "-o", f"ConnectTimeout={SSH_CONNECT_TIMEOUT}",
+            "-o", f"ControlPath={control_path}",
+            # 主连接一直保留到最后一个转发释放时的 -O exit；
+            # 程序异常退出留下的主连接在下次启动时由 reap_orphaned_masters 关闭
+            "-o", "ControlPersist=yes",
+            "-M", "-N", "-f",
+            "-p", str(port),
+            f"{username}@{host}"
+        ]
+        if key_path:
+            cmd[1:1] = ["-i", key_path]
+        if not password:
+            cmd[1:1] = ["-o", "BatchMode=yes"]
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Starting SSH master connection: %s", shlex.join(cmd))
+        
+        # ssh -f forks after authentication and the background child may keep
+        # stderr open, so read it from a file instead of waiting for pipe EOF
+        with tempfile.TemporaryFile() as err:
+            process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL,
+                                       stdout=subprocess.DEVNULL, stderr=err,
+                                       env=_password_env(password) if password else None)
+            try:
+                returncode = process.wait(timeout=MASTER_START_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                raise Exception(f"SSH connection to {host}:{port} timed out")
+            if returncode != 0:
+                err.seek(0)
+                error_msg = err.read().decode('utf-8', errors='replace').strip()
+                raise Exception(f"SSH connection failed: {error_msg}")
+        
+        check = _mux_command(self.ssh_command, control_path, key, "check")
+        match = re.search(r"pid=(\d+)", check.stderr if check else "")
+        if not match:
+            raise Exception(f"SSH master connection to {host}:{port} is not running")
+        return SSHSession(self.ssh_command, key, control_path, int(match.group(1)))
+    
+    def _connect_mux(self, host, port, username, local_port, key_path=None, password=None):
+        """
+        Add a SOCKS forward to a pooled master connection, starting a new
+        master when none has a free channel
+        
+        Args:
+            host (str): SSH server hostname or IP
+            port (int): SSH server port
+            username (str): SSH username
+            local_port (int): Local port for the SOCKS proxy
+            key_path (str, optional): Path to SSH private key
+            password (str, optional): SSH password, used if a new master is started
+            
+        Returns:
+            MuxTunnel: The forward, usable where connect() returns a process
+        """
+        key = (username, host, int(port), key_path or "")
+        session = self.pool.acquire(key)
+        if session is None:
+            session = self._start_master(key, password)
+            self.pool.add(session)
+        
+        tunnel = self._add_mux_forward(session, local_port)
+        logger.info("SSH connection established to %s:%s (shared master pid %s)", host, port, session.pid)
+        return tunnel
+    
+    def _add_mux_forward(self, session, local_port):
+        """
+        Add a SOCKS forward to a master on a channel already taken from the pool
+        
+        Args:
+            session (SSHSession): Master connection
+            local_port (int): Local port for the SOCKS proxy
+            
+        Returns:
+            MuxTunnel: The forward; the channel is given back if it fails
+        """
+        result = session.command("forward", "-D", f"127.0.0.1:{local_port}")
+        if result is None or result.returncode != 0:
+            self.pool.release(session)
+            error_msg = result.stderr.strip() if result else ""
+            raise Exception(f"SSH forward on port {local_port} failed: {error_msg}")
+        return MuxTunnel(self.pool, session, local_port)
+    
+    def add_socks_port(self, tunnel, local_port):
+        """
+        Open another SOCKS port over the SSH connection of an existing tunnel
+        
+        The port is a new channel on the same TCP connection, so it needs no
+        new handshake. Each port is closed on its own, with disconnect().
+        
+        Args:
+            tunnel (MuxTunnel or AsyncSSHTunnel): Tunnel returned by connect()
+            local_port (int): Local port for the new SOCKS proxy
+            
+        Returns:
+            MuxTunnel or AsyncSSHTunnel: The new forward
+        """
+        if isinstance(tunnel, AsyncSSHTunnel):
+            import asyncio
+            asyncssh = _import_asyncssh()
+            future = asyncio.run_coroutine_threadsafe(
+                self._aforward(tunnel._key, tunnel.conn, local_port), tunnel._loop)
+            try:
+                listener = future.result(timeout=MASTER_START_TIMEOUT)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                raise Exception(f"SSH forward on port {local_port} timed out")
+            except (OSError, asyncssh.Error) as e:
+                raise Exception(f"SSH forward on port {local_port} failed: {str(e)}")
+            return AsyncSSHTunnel(self, tunnel._loop, tunnel._key, tunnel.conn, listener, local_port)
+            
+        if isinstance(tunnel, MuxTunnel):
+            # sshd 的 MaxSessions 限制每个主连接的通道数
+            if not self.pool.reserve(tunnel.session):
+                raise Exception(f"SSH master connection (pid {tunnel.session.pid}) has no free channel")
+            return self._add_mux_forward(tunnel.session, local_port)
+            
+        raise Exception("Extra SOCKS ports need a shared connection (asyncssh or OpenSSH multiplexing)")
+    
+    async def aconnect(self, host, port, username, local_port, password=None, key_path=None):
+        """
+        Open a SOCKS forward with asyncssh, reusing this proxy's connection
+        to the same server when there is one
+        
+        Must run on the loop from _get_async_loop(), which owns the shared
+        connections.
+        
+        Args:
+            host (str): SSH server hostname or IP
+            port (int): SSH server port
+            username (str): SSH username
+            local_port (int): Local port for the SOCKS proxy
+            password (str, optional): SSH password
+            key_path (str, optional): Path to SSH private key
+            
+        Returns:
+            tuple: (asyncssh.SSHClientConnection, asyncssh.SSHListener)
+        """
+        import asyncio
+        asyncssh = _import_asyncssh()
+            
+        key = (username, host, int(port), key_path or "")
+        entry = self._async_conns.get(key)
+        if entry is None:
+            conn = await asyncssh.connect(
+                host,
+                port=int(port),
+                username=username,
+                password=password,
+                client_keys=[key_path] if key_path else (),
+                connect_timeout=SSH_CONNECT_TIMEOUT,
+                keepalive_interval=SERVER_ALIVE_INTERVAL,
+                keepalive_count_max=SERVER_ALIVE_COUNT_MAX
+            )
+            entry = self._async_conns[key] = [conn, 0]
+            
+            def forget(_):
+                # 连接断开后不再复用
+                if self._async_conns.get(key) is entry:
+                    del self._async_conns[key]
+            asyncio.ensure_future(conn.wait_closed()).add_done_callback(forget)
+            
+        conn = entry[0]
+        listener = await self._aforward(key, conn, local_port)
+        return conn, listener
+    
+    async def _aforward(self, key, conn, local_port):
+        """
+        Add a SOCKS listener to a shared asyncssh connection
+        
+        Args:
+            key (tuple): (username, host, port, key_path)
+            conn (asyncssh.SSHClientConnection): Connection opened by aconnect()
+            local_port (int): Local port for the SOCKS proxy
+            
+        Returns:
+            asyncssh.SSHListener: The new listener; close it with _arelease()
+        """
+        entry = self._async_conns.get(key)
+        if entry is None or entry[0] is not conn:
+            raise Exception("SSH connection has closed")
+        listener = await conn.forward_socks('127.0.0.1', local_port)
+        entry[1] += 1
+        return listener
+    
+    async def _arelease(self, key, conn, listener):
+        """
+        Close a forward opened by aconnect(), and its connection if no forward is left
+        
+        Args:
+            key (tuple): (username, host, port, key_path)
+            conn (asyncssh.SSHClientConnection): Connection carrying the forward
+            listener (asyncssh.SSHListener): SOCKS listener of the forward
+        """
+        listener.close()
+        await listener.wait_closed()
+        entry = self._async_conns.get(key)
+        if entry is None or entry[0] is not conn:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self._async_conns[key]
+            conn.close()
+            await conn.wait_closed()
+    
+    def _connect_async(self, host, port, username, local_port, key_path=None, password=None):
+        """
+        Run aconnect() on the background event loop and wait for the forward
+        
+        Args:
+            host (str): SSH server hostname or IP
+            port (int): SSH server port
+            username (str): SSH username
+            local_port (int): Local port for the SOCKS proxy
+            key_path (str, optional): Path to SSH private key
+            password (str, optional): SSH password
+            
+        Returns:
+            AsyncSSHTunnel: The forward, usable where connect() returns a process
+        """
+        asyncssh = _import_asyncssh()
+        loop = _get_async_loop()
+        import asyncio
+        future = asyncio.run_coroutine_threadsafe(
+            self.aconnect(host, port, username, local_port, password, key_path), loop)
+        try:
+            conn, listener = future.result(timeout=MASTER_START_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise Exception(f"SSH connection to {host}:{port} timed out")
+        except (OSError, asyncssh.Error) as e:
+            raise Exception(f"SSH connection failed: {str(e)}")
+            
+        logger.info(f"SSH connection established to {host}:{port} (asyncssh)")
+        key = (username, host, int(port), key_path or "")
+        return AsyncSSHTunnel(self, loop, key, conn, listener, local_port)
     
     def start_obfs_proxy(self, bridge, cert, iat_mode=0):
         """
@@ -231,37 +1233,60 @@ class SSHProxy:
             tuple: (进程对象, 本地端口)
         """
         try:
-            # 查找可用的本地端口
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.bind(('127.0.0.1', 0))
-                obfs_port = s.getsockname()[1]
-            
-            # 构建命令
-            cmd = [
-                "obfs4proxy",
-                "client",
-                f"socks5://127.0.0.1:{obfs_port}",
-                f"obfs4://{cert}@{bridge}?iat-mode={iat_mode}"
-            ]
-            
-            logger.info(f"Starting obfs4proxy: {' '.join(cmd)}")
-            
-            # 启动进程
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            
-            # 等待代理准备就绪
-            time.sleep(1)
-            if process.poll() is not None:
+            # 端口在关闭探测套接字后、obfs4proxy 绑定前可能被其他进程占用，此时换端口重试
+            for attempt in range(OBFS_PORT_ATTEMPTS):
+                # 查找可用的本地端口
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                    # 允许子进程在本套接字关闭后立即绑定同一端口
+                    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                    s.bind(('127.0.0.1', 0))
+                    obfs_port = s.getsockname()[1]
+                
+                # 构建命令
+                cmd = [
+                    "obfs4proxy",
+                    "client",
+                    f"socks5://127.0.0.1:{obfs_port}",
+                    f"obfs4://{cert}@{bridge}?iat-mode={iat_mode}"
+                ]
+                
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("Starting obfs4proxy: %s", shlex.join(cmd))
+                
+                # 启动进程
+                process = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True
+                )
+                
+                # 等待代理开始监听：探测端口，而不是固定等待
+                deadline = time.monotonic() + 2.0
+                delay = 0.01
+                while time.monotonic() < deadline:
+                    if process.poll() is not None:
+                        break
+                    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                        s.settimeout(0.05)
+                        if s.connect_ex(('127.0.0.1', obfs_port)) == 0:
+                            return (process, obfs_port)
+                    time.sleep(delay)
+                    delay = min(delay * 1.5, 0.1)
+                else:
+                    logger.error(f"obfs4proxy did not start listening on port {obfs_port}")
+                    self.stop_obfs_proxy(process)
+                    return (None, None)
+                
                 stdout, stderr = process.communicate()
+                if any(marker in stderr.lower() for marker in ADDRESS_IN_USE_MARKERS):
+                    logger.warning(f"Port {obfs_port} was taken before obfs4proxy bound it, retrying")
+                    continue
                 logger.error(f"obfs4proxy failed to start: {stderr}")
                 return (None, None)
             
-            return (process, obfs_port)
+            logger.error("obfs4proxy could not bind a local port")
+            return (None, None)
         except Exception as e:
             logger.error(f"Error starting obfs4proxy: {str(e)}")
             return (None, None)
@@ -278,126 +1303,244 @@ class SSHProxy:
                 except:
                     pass
     
-    def start_health_check(self, process, local_port, callback=None, interval=30):
+    def start_health_check(self, process, local_port, callback=None, interval=30,
+                           connect_args=None):
         """
         Start health check for the SSH tunnel
         
         Args:
-            process (subprocess.Popen): The SSH process
+            process: SSH process or (SSH process, Obfuscation protocol) tuple returned by connect()
             local_port (int): Local port of the tunnel
-            callback (function): Callback to notify health status changes
+            callback (function): Called from the health check thread as
+                callback(healthy, process) with the result of each check and the
+                current connection, which is a new one after a reconnect
             interval (int): Health check interval in seconds
+            connect_args (dict, optional): Keyword arguments for connect() other than
+                local_port (host, port, username, password, key_path, ...); without
+                them a failed check is only reported, not reconnected
+                
+        Returns:
+            threading.Event: Handle for stop_health_check() and disconnect()
         """
-        self.health_check_active = True
+        stop_event = threading.Event()
         
         def health_check_thread():
-            while self.health_check_active:
-                time.sleep(interval)
-                if not self.check_tunnel_health(local_port):
-                    logger.warning(f"Tunnel health check failed on port {local_port}")
+            nonlocal process
+            while not stop_event.is_set():
+                ssh_process = process[0] if isinstance(process, tuple) else process
+                # Wakes up as soon as ssh exits instead of after the full interval
+                exited = self._wait_for_exit(ssh_process, interval)
+                if stop_event.is_set():
+                    break
+                if not exited and self.check_tunnel_health(local_port, ssh_process):
                     if callback:
-                        callback(False)
-                    # Attempt reconnect
-                    try:
-                        logger.info("Attempting to reconnect...")
-                        new_process = self.connect(
-                            process.args['host'],
-                            process.args['port'],
-                            process.args['username'],
-                            local_port,
-                            password=process.args.get('password'),
-                            key_path=process.args.get('key_path')
-                        )
-                        if new_process:
-                            process = new_process
-                            if callback:
-                                callback(True)
-                    except Exception as e:
-                        logger.error(f"Reconnect failed: {str(e)}")
-                elif callback:
-                    callback(True)
+                        callback(True, process)
+                    continue
+                    
+                if exited:
+                    logger.warning(f"SSH process for port {local_port} has exited")
+                else:
+                    logger.warning(f"Tunnel health check failed on port {local_port}")
+                if callback:
+                    callback(False, process)
+                if connect_args is None:
+                    continue
+                    
+                # Attempt reconnect; a multiplexed tunnel only adds a forward to the shared master
+                try:
+                    logger.info("Attempting to reconnect...")
+                    self._close_for_reconnect(process)
+                    process = self.connect(local_port=local_port, **connect_args)
+                except Exception as e:
+                    logger.error(f"Reconnect failed: {str(e)}")
+                    continue
+                if stop_event.is_set():
+                    # 重连期间已断开：新连接无人持有，直接关闭
+                    self._close_for_reconnect(process)
+                    break
+                if callback:
+                    callback(True, process)
         
         threading.Thread(target=health_check_thread, daemon=True).start()
+        return stop_event
     
-    def stop_health_check(self):
-        """Stop the health check thread"""
-        self.health_check_active = False
+    def _wait_for_exit(self, ssh_process, timeout):
+        """
+        Wait up to timeout seconds, returning early when the SSH process exits
+        
+        Uses a pidfd on Linux and the process handle on Windows; elsewhere
+        it just sleeps.
+        
+        Args:
+            ssh_process: SSH process, MuxTunnel (whose pid is the master's)
+                or AsyncSSHTunnel
+            timeout (float): Seconds to wait
+            
+        Returns:
+            bool: True if the process has exited
+        """
+        if ssh_process is None or ssh_process.poll() is not None:
+            # Already gone (e.g. the last reconnect failed): keep the normal pace
+            time.sleep(timeout)
+            return True
+            
+        if isinstance(ssh_process, AsyncSSHTunnel):
+            try:
+                ssh_process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                return False
+            return True
+            
+        if hasattr(os, 'pidfd_open'):
+            try:
+                pidfd = os.pidfd_open(ssh_process.pid)
+            except ProcessLookupError:
+                return True
+            except OSError:
+                # Kernel without pidfd support (Linux < 5.3)
+                pidfd = None
+            if pidfd is not None:
+                try:
+                    with selectors.DefaultSelector() as selector:
+                        selector.register(pidfd, selectors.EVENT_READ)
+                        return bool(selector.select(timeout))
+                finally:
+                    os.close(pidfd)
+                    
+        handle = getattr(ssh_process, '_handle', None)
+        if self.platform == "Windows" and handle is not None:
+            import ctypes
+            WAIT_OBJECT_0 = 0
+            result = ctypes.windll.kernel32.WaitForSingleObject(int(handle), int(timeout * 1000))
+            return result == WAIT_OBJECT_0
+            
+        time.sleep(timeout)
+        return ssh_process.poll() is not None
+    
+    def _close_for_reconnect(self, process):
+        """
+        Close a failed tunnel before the health check reconnects it
+        
+        Unlike disconnect(), this leaves the health check running.
+        
+        Args:
+            process: SSH process or (SSH process, Obfuscation protocol) tuple returned by connect()
+        """
+        ssh_process, obfs_protocol_instance = process if isinstance(process, tuple) else (process, None)
+        if ssh_process and ssh_process.poll() is None:
+            self._terminate_ssh(ssh_process)
+        if obfs_protocol_instance:
+            obfs_protocol_instance.stop()
     
-    def check_tunnel_health(self, local_port):
+    def stop_health_check(self, health_check):
+        """
+        Stop a health check thread
+        
+        Args:
+            health_check (threading.Event): Handle returned by start_health_check()
+        """
+        health_check.set()
+    
+    def check_tunnel_health(self, local_port, process=None):
         """
         Check if the SSH tunnel is healthy by testing the local SOCKS port
         
         Args:
             local_port (int): Local port of the tunnel
+            process (optional): SSH process or MuxTunnel returned by connect(); a
+                multiplexed tunnel whose master has exited fails without a probe
             
         Returns:
             bool: True if tunnel is responsive, False otherwise
         """
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(2)
-                s.connect(('127.0.0.1', local_port))
-                return True
-        except:
+        # MuxTunnel.poll() only stats the control socket and signals the master
+        if isinstance(process, MuxTunnel) and process.poll() is not None:
             return False
+            
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.settimeout(0.2)
+            return s.connect_ex(('127.0.0.1', local_port)) == 0
     
-    def disconnect(self, processes):
+    def _terminate_ssh(self, ssh_process):
+        """
+        Stop an SSH process and its ProxyCommand children: SIGTERM to the
+        process group, escalating to SIGKILL after SSH_TERMINATE_GRACE
+        seconds; on Windows a forced kill of the process tree
+        
+        Args:
+            ssh_process: SSH process, MuxTunnel or AsyncSSHTunnel returned by connect()
+        """
+        if isinstance(ssh_process, (MuxTunnel, AsyncSSHTunnel)):
+            # 只关闭转发，共享的连接在最后一个转发关闭后才断开
+            ssh_process.terminate()
+            return
+            
+        if self.platform == "Windows":
+            # 无控制台（CREATE_NO_WINDOW）的进程收不到 CTRL_BREAK_EVENT，
+            # 用 taskkill /T 结束整个进程树，包括 ProxyCommand 子进程
+            subprocess.run(
+                ["taskkill", "/F", "/T", "/PID", str(ssh_process.pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                creationflags=subprocess.CREATE_NO_WINDOW
+            )
+            # 回收进程以释放进程/线程句柄
+            try:
+                ssh_process.wait(timeout=1.0)
+            except subprocess.TimeoutExpired:
+                ssh_process.kill()
+            return
+            
+        # Unix: 进程以 start_new_session 启动，信号会同时送达 ProxyCommand 子进程
+        try:
+            os.killpg(ssh_process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+            
+        try:
+            ssh_process.wait(timeout=SSH_TERMINATE_GRACE)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(ssh_process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            # 回收进程以释放进程/线程句柄
+            ssh_process.wait(timeout=1.0)
+    
+    def disconnect(self, processes, obfs_protocol_instance=None, health_check=None):
         """
         Disconnect SSH and clean up processes
         
         Args:
             processes: SSH process or (SSH process, Obfuscation protocol) tuple
+            obfs_protocol_instance (ObfuscationProtocol, optional): Obfuscation
+                protocol to stop, when processes is a bare SSH process
+            health_check (threading.Event, optional): Handle from start_health_check(),
+                stopped first so the check does not reconnect the tunnel
         """
+        ssh_process, obfs_protocol_instance = (
+            processes if isinstance(processes, tuple) else (processes, obfs_protocol_instance))
+        if health_check is not None:
+            self.stop_health_check(health_check)
+            
         try:
-            if isinstance(processes, tuple):
-                ssh_process, obfs_protocol_instance = processes
-                # 先关闭SSH进程
-                if ssh_process and ssh_process.poll() is None:
-                    # 先尝试停止健康检查（如果存在）
-                    if hasattr(self, 'health_check_active'):
-                        self.stop_health_check()
-                    logger.info("Terminating SSH connection...")
-                    
-                    if self.platform == "Windows":
-                        subprocess.call(['taskkill', '/F', '/T', '/PID', str(ssh_process.pid)])
-                    else:
-                        ssh_process.terminate()
-                        ssh_process.wait(timeout=5)
-                    
-                    logger.info("SSH connection terminated")
+            # 先关闭SSH进程，再关闭混淆协议实例
+            if ssh_process and ssh_process.poll() is None:
+                logger.info("Terminating SSH connection...")
+                self._terminate_ssh(ssh_process)
+                logger.info("SSH connection terminated")
+                
+            if obfs_protocol_instance:
+                logger.info("Stopping obfuscation proxy...")
+                obfs_protocol_instance.stop()
+                logger.info("Obfuscation proxy terminated")
                 
-                # 再关闭混淆协议实例
-                if obfs_protocol_instance:
-                    logger.info("Stopping obfuscation proxy...")
-                    obfs_protocol_instance.stop()
-                    logger.info("Obfuscation proxy terminated")
-            else:
-                # 只有SSH进程
-                ssh_process = processes
-                if ssh_process and ssh_process.poll() is None:
-                    # 先尝试停止健康检查（如果存在）
-                    if hasattr(self, 'health_check_active'):
-                        self.stop_health_check()
-                    logger.info("Terminating SSH connection...")
-                    
-                    if self.platform == "Windows":
-                        subprocess.call(['taskkill', '/F', '/T', '/PID', str(ssh_process.pid)])
-                    else:
-                        ssh_process.terminate()
-                        ssh_process.wait(timeout=5)
-                    
-                    logger.info("SSH connection terminated")
-                    
         except Exception as e:
             logger.error(f"Error disconnecting SSH: {str(e)}")
             # 尝试强制终止进程
             try:
-                if isinstance(processes, tuple):
-                    ssh_process, _ = processes
-                    if ssh_process and ssh_process.poll() is None:
-                        ssh_process.kill()
-                elif processes and processes.poll() is None:
-                    processes.kill()
+                if ssh_process and ssh_process.poll() is None:
+                    ssh_process.kill()
             except:
                 pass
     
@@ -449,4 +1592,8 @@ def test_ssh_proxy():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
     test_ssh_proxy()